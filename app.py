@@ -1,10 +1,11 @@
 import streamlit as st
 from utils.logger import log_info, log_error
-from config import DEBUG, AUTH, MENU_OPTIONS
+from config import DEBUG, AUTH, MENU_OPTIONS, JOBS_CONFIG
 import authentication
 import dashboards
 import data_loader
 import os
+import time
 
 def main():
     # Get port from Railway environment
@@ -16,7 +17,7 @@ def main():
         layout="wide"
     )
     
-    log_info(f"Запуск приложения на порту {port}")
+    log_info("Запуск приложения на порту {}", port)
     
     # Инициализация состояния сессии
     if 'authenticated' not in st.session_state:
@@ -34,7 +35,7 @@ def main():
             show_main_app()
 
     except Exception as e:
-        log_error(f"Ошибка приложения: {str(e)}")
+        log_error("Ошибка приложения: {}", e)
         st.error("Произошла ошибка в приложении. Пожалуйста, попробуйте позже.")
 
 def show_main_app():
@@ -47,6 +48,11 @@ def show_main_app():
             if st.button("Выйти"):
                 authentication.logout()
         
+        # Загрузка продолжается в фоне при переходе на другие страницы
+        upload_job = data_loader.data_loader.jobs.get(st.session_state.get('upload_job_id'))
+        if upload_job is not None and not upload_job.is_finished():
+            st.caption(f"⏳ Идет загрузка данных: {upload_fraction(upload_job.snapshot()['progress']):.0%}")
+        
         selected_page = st.radio(
             "Навигация",
             list(MENU_OPTIONS.keys()),
@@ -82,17 +88,99 @@ def show_settings_page():
         - Budget (Category, BudgetAmount)
         """)
         
+        upload_mode = st.radio(
+            "Режим загрузки",
+            ["replace", "append"],
+            format_func=lambda x: {
+                "replace": "Заменить все данные",
+                "append": "Добавить новые доходы и расходы"
+            }[x],
+            horizontal=True
+        )
+        if upload_mode == "append":
+            st.caption("Файл может содержать только листы Income и/или Expenses. "
+                       "Строки с уже загруженными IncomeID/ExpenseID будут пропущены.")
+        
         uploaded_file = st.file_uploader("Выберите файл Excel", type=['xlsx'])
-        if uploaded_file:
+        # Файл обрабатывается один раз: повторные запуски скрипта не загружают его заново
+        if uploaded_file and uploaded_file.file_id != st.session_state.get('uploaded_file_id'):
+            st.session_state.uploaded_file_id = uploaded_file.file_id
             try:
-                data_loader.process_uploaded_file(uploaded_file)
-                st.success("✅ Файл успешно загружен!")
-            except ValueError as ve:
-                log_error(f"Ошибка валидации файла: {str(ve)}")
-                st.error(f"❌ Ошибка в структуре файла: {str(ve)}")
+                job = data_loader.start_upload(uploaded_file, upload_mode)
+                st.session_state.upload_job_id = job.id
             except Exception as e:
-                log_error(f"Ошибка загрузки файла: {str(e)}")
+                log_error("Ошибка загрузки файла: {}", e)
                 st.error("❌ Ошибка при загрузке файла. Проверьте формат данных.")
+        
+        upload_running = show_upload_progress(st.session_state.get('upload_job_id'))
+
+    with st.expander("📥 Экспорт данных"):
+        # Excel-файл формируется только по запросу пользователя
+        if st.button("Подготовить Excel-файл"):
+            st.session_state.export_requested = True
+        
+        if st.session_state.get('export_requested'):
+            excel_data = data_loader.data_loader.export_to_excel()
+            if excel_data is None:
+                st.info("Данные еще не загружены")
+            else:
+                st.download_button(
+                    "Скачать Excel-файл",
+                    data=excel_data,
+                    file_name="financial_data.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+    
+    # Страница перерисовывается, пока фоновая загрузка не завершится
+    if upload_running:
+        time.sleep(JOBS_CONFIG["POLL_INTERVAL"])
+        st.rerun()
+
+def upload_fraction(progress):
+    """Доля выполнения загрузки по прогрессу отдельных листов"""
+    if not progress:
+        return 0.0
+    fractions = []
+    for values in progress.values():
+        if values.get('stage') == 'done':
+            fractions.append(1.0)
+        elif values.get('total_rows'):
+            fractions.append(min(values.get('rows_validated', 0) / values['total_rows'], 1.0))
+        else:
+            fractions.append(0.0)
+    return sum(fractions) / len(fractions)
+
+def show_upload_progress(job_id):
+    """Состояние фоновой загрузки файла; возвращает True, пока загрузка идет"""
+    job = data_loader.data_loader.jobs.get(job_id)
+    if job is None:
+        return False
+    state = job.snapshot()
+    
+    if state['status'] == 'done':
+        if state['name'] == 'upload_append':
+            added = state['result']
+            st.success(f"✅ Добавлено строк: доходы — {added.get('income', 0)}, "
+                       f"расходы — {added.get('expenses', 0)}")
+        else:
+            st.success("✅ Файл успешно загружен!")
+        return False
+    
+    if state['status'] == 'failed':
+        if isinstance(job.exception, ValueError):
+            st.error(f"❌ Ошибка в структуре файла: {state['error']}")
+        else:
+            st.error("❌ Ошибка при загрузке файла. Проверьте формат данных.")
+        return False
+    
+    st.progress(upload_fraction(state['progress']), text="⏳ Обработка файла...")
+    for sheet_name, values in state['progress'].items():
+        st.caption(
+            f"{sheet_name}: прочитано строк — {values.get('rows_parsed', 0)}, "
+            f"проверено — {values.get('rows_validated', 0)}, "
+            f"записано — {values.get('bytes_written', 0) / 1024:.0f} КБ"
+        )
+    return True
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
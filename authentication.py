@@ -1,9 +1,16 @@
 import streamlit as st
-import yaml
-from yaml.loader import SafeLoader
+import copy
+from http.cookies import SimpleCookie
 from pathlib import Path
+import jwt
 import streamlit_authenticator as stauth
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from config import AUTH_CONFIG, JOBS_CONFIG, LOGIN_THROTTLE_CONFIG
+from utils.cache import SessionCache
+from utils.credentials import CredentialsStore
+from utils.jobs import JobRunner
 from utils.logger import log_info, log_error, log_warning
+from utils.throttle import LoginThrottle
 import re
 
 # Путь к файлу с учетными данными
@@ -29,29 +36,96 @@ def is_valid_username(username):
         return False, "Имя пользователя может содержать только буквы, цифры и знак подчеркивания"
     return True, "Имя пользователя корректно"
 
-def load_credentials():
-    """Загрузка учетных данных из файла"""
-    if not CREDENTIALS_FILE.exists():
-        default_credentials = {
-            "usernames": {
-                "admin": {
-                    "name": "Админ",
-                    "password": stauth.Hasher(['admin123']).generate()[0],
-                    "email": "admin@example.com"
-                }
+def default_credentials():
+    """Учетные данные по умолчанию для первого запуска"""
+    return {
+        "usernames": {
+            "admin": {
+                "name": "Админ",
+                "password": stauth.Hasher(['admin123']).generate()[0],
+                "email": "admin@example.com"
             }
         }
-        save_credentials(default_credentials)
-        log_info("Создан файл credentials.yaml с учетными данными по умолчанию")
-    
-    with open(CREDENTIALS_FILE) as file:
-        return yaml.load(file, Loader=SafeLoader)
+    }
+
+# Разобранные учетные данные хранятся в памяти процесса и перечитываются при изменении файла
+credentials_store = CredentialsStore(CREDENTIALS_FILE, default_credentials)
+
+def load_credentials():
+    """Загрузка учетных данных из файла"""
+    return credentials_store.load()
 
 def save_credentials(credentials):
     """Сохранение учетных данных в файл"""
-    with open(CREDENTIALS_FILE, "w") as file:
-        yaml.dump(credentials, file)
-    log_info("Учетные данные успешно сохранены")
+    def replace(current):
+        current.clear()
+        current.update(copy.deepcopy(credentials))
+    credentials_store.update(replace)
+
+# Проверенные cookie повторного входа: новые сессии браузера входят без создания Authenticate
+session_cache = SessionCache(AUTH_CONFIG["SESSION_MAX_ENTRIES"], AUTH_CONFIG["SESSION_TTL"])
+
+# Хэширование bcrypt занимает сотни миллисекунд, поэтому выполняется вне потока скрипта
+auth_jobs = JobRunner(AUTH_CONFIG["HASH_WORKERS"])
+
+# Попытки входа ограничиваются до проверки пароля bcrypt
+login_throttle = LoginThrottle(
+    LOGIN_THROTTLE_CONFIG["CAPACITY"],
+    LOGIN_THROTTLE_CONFIG["REFILL_SECONDS"],
+    LOGIN_THROTTLE_CONFIG["FREE_FAILURES"],
+    LOGIN_THROTTLE_CONFIG["BACKOFF_BASE"],
+    LOGIN_THROTTLE_CONFIG["BACKOFF_MAX"],
+    LOGIN_THROTTLE_CONFIG["IDLE_TTL"],
+    LOGIN_THROTTLE_CONFIG["MAX_ENTRIES"]
+)
+
+class ThrottledAuthenticate(stauth.Authenticate):
+    """Authenticate с ограничением частоты попыток входа перед проверкой пароля"""
+
+    def _check_credentials(self, inplace=True):
+        client = client_id()
+        # Счетчики заводятся только для существующих пользователей: иначе выдуманные
+        # имена бесплатно заполняли бы память ограничителя
+        user_key = f"user:{self.username}" if self.username in self.credentials['usernames'] else None
+        keys = (user_key, f"client:{client}" if client else None)
+        wait = login_throttle.acquire(*keys)
+        if wait > 0:
+            st.session_state['login_retry_after'] = wait
+            st.session_state['authentication_status'] = False
+            return False
+        result = super()._check_credentials(inplace)
+        if result or st.session_state['authentication_status']:
+            login_throttle.success(user_key)
+        else:
+            login_throttle.failure(*keys)
+            log_warning("Неудачная попытка входа для пользователя '{}'", self.username)
+        return result
+
+def hash_password(password):
+    """Хэш пароля bcrypt"""
+    return stauth.Hasher([password]).generate()[0]
+
+def create_user(job, username, user, password):
+    """Фоновая регистрация: имя пользователя или None, если имя уже занято"""
+    added = credentials_store.add_user(username, {**user, "password": hash_password(password)})
+    return username if added else None
+
+def change_password(job, username, password):
+    """Фоновая смена пароля: имя пользователя или None, если пользователь не найден"""
+    return username if credentials_store.set_password(username, hash_password(password)) else None
+
+def finished_auth_job(state_key, message):
+    """Завершенная фоновая задача формы или None; пока задача выполняется, страница ожидает ее"""
+    job = auth_jobs.get(st.session_state.get(state_key))
+    if job is None:
+        return None
+    # Обычно задача (хэширование пароля) завершается за доли секунды, и страница
+    # получает результат без перезапуска; дольше POLL_INTERVAL ждем через st.rerun
+    if not job.wait(JOBS_CONFIG["POLL_INTERVAL"]):
+        st.info(message)
+        st.rerun()
+    del st.session_state[state_key]
+    return job
 
 def register_user():
     """Форма регистрации нового пользователя"""
@@ -61,6 +135,21 @@ def register_user():
     if 'registration_successful' not in st.session_state:
         st.session_state.registration_successful = False
     
+    job = finished_auth_job('registration_job_id', "⏳ Регистрация пользователя...")
+    if job is not None:
+        if job.status == 'failed':
+            st.error("Произошла ошибка при регистрации. Попробуйте позже.")
+        elif job.result is None:
+            # Имя заняли параллельной регистрацией, пока хэшировался пароль
+            st.error("Пользователь с таким именем уже существует")
+        else:
+            st.success("Регистрация успешно завершена! Теперь вы можете войти в систему.")
+            log_info("Зарегистрирован новый пользователь: {}", job.result)
+            
+            # Устанавливаем флаг успешной регистрации
+            st.session_state.registration_successful = True
+            st.rerun()
+    
     with st.form("registration_form"):
         new_username = st.text_input("Имя пользователя")
         new_name = st.text_input("Полное имя")
@@ -72,15 +161,13 @@ def register_user():
         
         if submitted:
             try:
-                credentials = load_credentials()
-                
                 # Проверка валидности данных
                 username_valid, username_msg = is_valid_username(new_username)
                 if not username_valid:
                     st.error(username_msg)
                     return
                 
-                if new_username in credentials["usernames"]:
+                if credentials_store.get_user(new_username) is not None:
                     st.error("Пользователь с таким именем уже существует")
                     return
                 
@@ -93,24 +180,16 @@ def register_user():
                     st.error("Пароли не совпадают")
                     return
                 
-                # Сохранение нового пользователя
-                hashed_password = stauth.Hasher([new_password]).generate()[0]
-                credentials["usernames"][new_username] = {
-                    "name": new_name,
-                    "password": hashed_password,
-                    "email": new_email
-                }
-                
-                save_credentials(credentials)
-                st.success("Регистрация успешно завершена! Теперь вы можете войти в систему.")
-                log_info(f"Зарегистрирован новый пользователь: {new_username}")
-                
-                # Устанавливаем флаг успешной регистрации
-                st.session_state.registration_successful = True
+                # Хэширование и сохранение нового пользователя в фоне
+                job = auth_jobs.submit(
+                    "register_user", create_user, new_username,
+                    {"name": new_name, "email": new_email}, new_password
+                )
+                st.session_state.registration_job_id = job.id
                 st.rerun()
                 
             except Exception as e:
-                log_error(f"Ошибка при регистрации: {str(e)}")
+                log_error("Ошибка при регистрации: {}", e)
                 st.error("Произошла ошибка при регистрации. Попробуйте позже.")
 
 def reset_password():
@@ -121,6 +200,20 @@ def reset_password():
     if 'password_reset_successful' not in st.session_state:
         st.session_state.password_reset_successful = False
     
+    job = finished_auth_job('password_reset_job_id', "⏳ Обновление пароля...")
+    if job is not None:
+        if job.status == 'failed':
+            st.error("Произошла ошибка при сбросе пароля. Попробуйте позже.")
+        elif job.result is None:
+            st.error("Пользователь не найден")
+        else:
+            st.success("Пароль успешно обновлен! Теперь вы можете войти с новым паролем.")
+            log_info("Пароль обновлен для пользователя: {}", job.result)
+            
+            # Устанавливаем флаг успешного сброса пароля
+            st.session_state.password_reset_successful = True
+            st.rerun()
+    
     with st.form("reset_password_form"):
         username = st.text_input("Имя пользователя")
         email = st.text_input("Email")
@@ -131,13 +224,11 @@ def reset_password():
         
         if submitted:
             try:
-                credentials = load_credentials()
-                
-                if username not in credentials["usernames"]:
+                if credentials_store.get_user(username) is None:
                     st.error("Пользователь не найден")
                     return
                 
-                if credentials["usernames"][username]["email"] != email:
+                if username not in credentials_store.usernames_for_email(email):
                     st.error("Указанный email не соответствует учетной записи")
                     return
                 
@@ -150,20 +241,13 @@ def reset_password():
                     st.error("Пароли не совпадают")
                     return
                 
-                # Обновление пароля
-                hashed_password = stauth.Hasher([new_password]).generate()[0]
-                credentials["usernames"][username]["password"] = hashed_password
-                
-                save_credentials(credentials)
-                st.success("Пароль успешно обновлен! Теперь вы можете войти с новым паролем.")
-                log_info(f"Пароль обновлен для пользователя: {username}")
-                
-                # Устанавливаем флаг успешного сброса пароля
-                st.session_state.password_reset_successful = True
+                # Хэширование и обновление пароля в фоне
+                job = auth_jobs.submit("reset_password", change_password, username, new_password)
+                st.session_state.password_reset_job_id = job.id
                 st.rerun()
                 
             except Exception as e:
-                log_error(f"Ошибка при сбросе пароля: {str(e)}")
+                log_error("Ошибка при сбросе пароля: {}", e)
                 st.error("Произошла ошибка при сбросе пароля. Попробуйте позже.")
 
 def show_auth_page():
@@ -217,26 +301,96 @@ def show_auth_page():
     
     return authenticator, name
 
+def request_headers():
+    """Заголовки HTTP-запроса текущей сессии или пустой словарь"""
+    try:
+        from streamlit.web.server.websocket_headers import _get_websocket_headers
+        return _get_websocket_headers() or {}
+    except Exception:
+        return {}
+
+def request_cookie(name):
+    """Значение cookie из заголовков запроса текущей сессии или None"""
+    cookies = SimpleCookie(request_headers().get("Cookie", ""))
+    return cookies[name].value if name in cookies else None
+
+def client_id():
+    """Адрес клиента, установленный доверенным прокси, или идентификатор сессии"""
+    if LOGIN_THROTTLE_CONFIG["TRUSTED_PROXY"]:
+        headers = request_headers()
+        # Первые адреса X-Forwarded-For задает сам клиент, достоверен только добавленный прокси
+        forwarded = headers.get("X-Real-Ip") or headers.get("X-Forwarded-For", "").split(",")[-1].strip()
+        if forwarded:
+            return forwarded
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def cached_session():
+    """Пользователь ранее проверенной cookie текущего запроса или None"""
+    if st.session_state.get('logout'):
+        return None
+    token = request_cookie(AUTH_CONFIG["COOKIE_NAME"])
+    if token is None:
+        return None
+    session = session_cache.get(token)
+    if session is None or credentials_store.get_user(session["username"]) is None:
+        return None
+    st.session_state.session_token = token
+    return session
+
+def remember_session(authenticator, username, name):
+    """Сохранение проверенной cookie повторного входа в кэше сессий"""
+    # После входа по паролю token - новая cookie, после входа по cookie - ее расшифровка
+    token = getattr(authenticator, "token", None)
+    if not isinstance(token, str):
+        token = request_cookie(AUTH_CONFIG["COOKIE_NAME"])
+    if token is None:
+        return
+    try:
+        payload = jwt.decode(token, AUTH_CONFIG["COOKIE_KEY"], algorithms=["HS256"])
+    except jwt.PyJWTError:
+        return
+    session_cache.put(token, {"username": username, "name": name}, expires_at=payload.get("exp_date"))
+    st.session_state.session_token = token
+
+def start_session(username, name):
+    """Отметка сессии Streamlit как аутентифицированной"""
+    st.session_state.authenticated = True
+    st.session_state.username = username
+    st.session_state['name'] = name
+    st.session_state['authentication_status'] = True
+    st.session_state['logout'] = False
+
 def authenticate_users():
     """Аутентификация пользователей"""
+    session = cached_session()
+    if session is not None:
+        start_session(session["username"], session["name"])
+        log_info("Пользователь '{}' вошел в систему по сохраненной сессии", session['username'])
+        return None, session["name"]
+    
     credentials = load_credentials()
-    authenticator = stauth.Authenticate(
+    authenticator = ThrottledAuthenticate(
         credentials,
-        "personal_finance_dashboard",
-        "auth_cookie",
-        cookie_expiry_days=30
+        AUTH_CONFIG["COOKIE_NAME"],
+        AUTH_CONFIG["COOKIE_KEY"],
+        cookie_expiry_days=AUTH_CONFIG["COOKIE_EXPIRY_DAYS"]
     )
     
     name, authentication_status, username = authenticator.login("Вход в систему", "main")
     
     if authentication_status:
-        st.session_state.authenticated = True
-        st.session_state.username = username
-        log_info(f"Пользователь '{username}' вошел в систему")
+        start_session(username, name)
+        remember_session(authenticator, username, name)
+        log_info("Пользователь '{}' вошел в систему", username)
         return authenticator, name
     elif authentication_status == False:
-        st.error("❌ Неверное имя пользователя или пароль")
-        log_warning(f"Неудачная попытка входа для пользователя '{username}'")
+        retry_after = st.session_state.pop('login_retry_after', None)
+        if retry_after:
+            st.error(f"⏳ Слишком много попыток входа. Повторите через {retry_after:.0f} с")
+        else:
+            # Неудачная проверка пароля записывается в журнал в ThrottledAuthenticate
+            st.error("❌ Неверное имя пользователя или пароль")
         return None, None
     elif authentication_status == None:
         st.info("👋 Пожалуйста, войдите в систему")
@@ -248,6 +402,10 @@ def logout():
         username = st.session_state.get('username')
         st.session_state.authenticated = False
         st.session_state.username = None
-        log_info(f"Пользователь '{username}' вышел из системы")
+        # Cookie больше не открывает сессию ни через кэш, ни через Authenticate
+        session_cache.pop(st.session_state.pop('session_token', None))
+        st.session_state['authentication_status'] = None
+        st.session_state['logout'] = True
+        log_info("Пользователь '{}' вышел из системы", username)
         st.success("👋 Вы успешно вышли из системы")
         st.rerun() 
\ No newline at end of file
@@ -20,7 +20,69 @@ LOG_CONFIG = {
     "DEBUG": DEBUG,
     "LOG_FILE": LOGS_DIR / "app.log",
     "MAX_SIZE": "500 MB",
-    "RETENTION": "10 days"
+    "RETENTION": "10 days",
+    # Записи в формате JSON lines (по одному объекту на строку)
+    "JSON": os.getenv("LOG_JSON", "false").lower() == "true",
+    # Уровни отдельных модулей: "data_loader=DEBUG,utils.storage=WARNING"
+    "MODULE_LEVELS": dict(
+        item.strip().split("=", 1)
+        for item in os.getenv("LOG_LEVELS", "").split(",")
+        if "=" in item
+    )
+}
+
+# Настройки кэша данных (общий для всех сессий процесса)
+CACHE_CONFIG = {
+    "MAX_BYTES": int(os.getenv("CACHE_MAX_MB", "256")) * 1024 * 1024,
+    "FIGURE_MAX_BYTES": int(os.getenv("FIGURE_CACHE_MAX_MB", "64")) * 1024 * 1024
+}
+
+# Настройки загрузки данных
+INGEST_CONFIG = {
+    # Файлы больше порога загружаются потоково, пакетами по BATCH_SIZE строк
+    "STREAMING_THRESHOLD_BYTES": int(os.getenv("INGEST_STREAMING_THRESHOLD_MB", "10")) * 1024 * 1024,
+    "BATCH_SIZE": int(os.getenv("INGEST_BATCH_SIZE", "50000")),
+    # Число процессов для параллельного разбора листов; 0 или 1 - разбор в одном процессе
+    "PARALLEL_WORKERS": int(os.getenv("INGEST_PARALLEL_WORKERS", "0"))
+}
+
+# Хранилище данных: "parquet" (снимки колоночных файлов) или "sqlite" (локальная база)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "parquet")
+
+# Фоновые задачи: предварительный расчет данных страниц после загрузки
+JOBS_CONFIG = {
+    "MAX_WORKERS": int(os.getenv("JOBS_MAX_WORKERS", "2")),
+    # Интервал, с которым страница проверяет завершение фоновой задачи, в секундах
+    "POLL_INTERVAL": float(os.getenv("JOBS_POLL_INTERVAL", "1.0"))
+}
+
+# Аутентификация: cookie повторного входа и кэш проверенных сессий
+AUTH_CONFIG = {
+    "COOKIE_NAME": "personal_finance_dashboard",
+    "COOKIE_KEY": "auth_cookie",
+    "COOKIE_EXPIRY_DAYS": 30,
+    # Время жизни проверенной сессии в кэше сервера, в секундах
+    "SESSION_TTL": int(os.getenv("AUTH_SESSION_TTL", "3600")),
+    "SESSION_MAX_ENTRIES": int(os.getenv("AUTH_SESSION_MAX_ENTRIES", "1000")),
+    # Потоки для хэширования паролей bcrypt вне потока скрипта
+    "HASH_WORKERS": int(os.getenv("AUTH_HASH_WORKERS", "2"))
+}
+
+# Ограничение попыток входа по имени пользователя и по клиенту
+LOGIN_THROTTLE_CONFIG = {
+    # Запас попыток и время восстановления одной попытки, в секундах
+    "CAPACITY": int(os.getenv("LOGIN_THROTTLE_CAPACITY", "5")),
+    "REFILL_SECONDS": float(os.getenv("LOGIN_THROTTLE_REFILL_SECONDS", "30")),
+    # Неудачи подряд без задержки; далее задержка удваивается от BACKOFF_BASE до BACKOFF_MAX секунд
+    "FREE_FAILURES": 3,
+    "BACKOFF_BASE": 2.0,
+    "BACKOFF_MAX": 900.0,
+    # Простаивающие счетчики удаляются; IDLE_TTL должен превышать BACKOFF_MAX
+    "IDLE_TTL": 3600.0,
+    "MAX_ENTRIES": 10000,
+    # Доверять адресу клиента из X-Real-Ip/X-Forwarded-For только за своим прокси,
+    # иначе клиент подставляет заголовок сам; без прокси ключ - идентификатор сессии
+    "TRUSTED_PROXY": os.getenv("LOGIN_THROTTLE_TRUSTED_PROXY", "false").lower() == "true"
 }
 
 # Меню на русском языке
@@ -33,9 +95,26 @@ MENU_OPTIONS = {
     "settings": "Настройки"
 }
 
+# Скользящие статистики трендов расходов: окно в месяцах, период EWMA и перцентили
+TREND_CONFIG = {
+    "WINDOW": int(os.getenv("TREND_WINDOW", "3")),
+    "EWMA_SPAN": int(os.getenv("TREND_EWMA_SPAN", "6")),
+    "QUANTILES": (0.1, 0.9)
+}
+
+# Периоды группировки доходов и расходов
+PERIOD_OPTIONS = {
+    "week": "Неделя",
+    "month": "Месяц",
+    "quarter": "Квартал",
+    "year": "Год"
+}
+
 # Настройки валюты
 CURRENCY_SYMBOL = "₽"
 CURRENCY_FORMAT = "{:,.2f} ₽"
+# Суммы хранятся и агрегируются в целых копейках
+CURRENCY_MINOR_UNITS = 100
 
 # Настройки графиков
 CHART_COLORS = {
@@ -46,4 +125,16 @@ CHART_COLORS = {
     "net_worth": "#9b59b6"
 }
 
+# Политика отрисовки графиков, общая для всех страниц:
+# - длинные ряды прореживаются (LTTB) до MAX_POINTS точек на линию;
+# - линии длиннее WEBGL_THRESHOLD точек рисуются через WebGL (go.Scattergl);
+# - если сериализованный график больше MAX_FIGURE_BYTES, число точек
+#   уменьшается вдвое, но не ниже MIN_POINTS
+CHART_CONFIG = {
+    "MAX_POINTS": int(os.getenv("CHART_MAX_POINTS", "1000")),
+    "MIN_POINTS": int(os.getenv("CHART_MIN_POINTS", "100")),
+    "WEBGL_THRESHOLD": int(os.getenv("CHART_WEBGL_THRESHOLD", "500")),
+    "MAX_FIGURE_BYTES": int(os.getenv("CHART_MAX_FIGURE_KB", "1024")) * 1024
+}
+
 # ... остальной код ... 
\ No newline at end of file
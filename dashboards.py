@@ -1,16 +1,74 @@
 import streamlit as st
 import plotly.graph_objects as go
 import plotly.express as px
-from utils.logger import log_info, log_error, log_debug
+from utils.logger import log_info, log_error, log_debug, log_warning
 from utils.data_processor import (
     format_currency, 
     calculate_growth_rate, 
     get_trend_analysis,
-    categorize_expenses
+    categorize_expenses,
+    categorize_expenses_matrix,
+    downsample_frame
 )
 from data_loader import data_loader
-from config import MENU_OPTIONS, CHART_COLORS, CURRENCY_SYMBOL
+from config import MENU_OPTIONS, PERIOD_OPTIONS, CHART_COLORS, CHART_CONFIG, TREND_CONFIG, CURRENCY_SYMBOL, CACHE_CONFIG, JOBS_CONFIG
+from utils.cache import SnapshotCache
 import pandas as pd
+import time
+
+# Кэш построенных графиков, общий для всех сессий
+figure_cache = SnapshotCache(CACHE_CONFIG["FIGURE_MAX_BYTES"])
+
+def figure_points(fig):
+    """Общее число точек всех линий графика"""
+    return sum(len(trace.x) for trace in fig.data if trace.x is not None)
+
+def cached_figure(name, build, *args):
+    """Построение графика с кэшированием по версии данных, графику и параметрам фильтров
+    
+    Функция build принимает максимальное число точек на линию. График сериализуется
+    один раз для оценки размера; если он превышает допустимый, число точек
+    уменьшается пропорционально и график перестраивается без повторной сериализации.
+    """
+    key = (data_loader.data_version(), name) + args
+    fig = figure_cache.get(key)
+    if fig is None:
+        max_points = CHART_CONFIG["MAX_POINTS"]
+        fig = build(max_points)
+        size = len(fig.to_json())
+        if size > CHART_CONFIG["MAX_FIGURE_BYTES"] and max_points > CHART_CONFIG["MIN_POINTS"]:
+            # Размер растет пропорционально числу точек: новый оценивается по измеренному
+            points = figure_points(fig)
+            max_points = max(int(max_points * CHART_CONFIG["MAX_FIGURE_BYTES"] / size), CHART_CONFIG["MIN_POINTS"])
+            fig = build(max_points)
+            if points:
+                size = size * figure_points(fig) // points
+        if size > CHART_CONFIG["MAX_FIGURE_BYTES"]:
+            log_warning("График {} превышает допустимый размер: {} байт", name, size)
+        
+        # Размер записи оценивается по объему сериализованного графика
+        figure_cache.put(key, fig, size=size)
+        log_debug("Построен график {} {}: {} байт, до {} точек на линию", name, args, size, max_points)
+    return fig
+
+def make_scatter(x, y, **kwargs):
+    """Линия графика: при большом числе точек используется WebGL (Scattergl)"""
+    trace_type = go.Scattergl if len(x) > CHART_CONFIG["WEBGL_THRESHOLD"] else go.Scatter
+    return trace_type(x=x, y=y, **kwargs)
+
+def show_computing_state():
+    """Сообщение о фоновом расчете данных с периодической проверкой готовности"""
+    st.info("⏳ Данные еще рассчитываются, страница обновится автоматически")
+    time.sleep(JOBS_CONFIG["POLL_INTERVAL"])
+    st.rerun()
+
+def wait_for_precompute():
+    """Сообщение о фоновом расчете сводок; True, если страница должна дождаться его"""
+    # После загрузки сводки рассчитываются в фоне, страница ждет их без блокировки
+    if not data_loader.is_precomputing():
+        return False
+    show_computing_state()
+    return True
 
 def show_metric_card(title, value, previous_value=None, prefix="", suffix=""):
     """Отображение метрики с изменением"""
@@ -29,11 +87,15 @@ def show_dashboard_page():
     st.title("📊 Панель управления")
     
     try:
-        # Загрузка данных
-        net_worth_summary = data_loader.get_net_worth_summary()
-        income_summary = data_loader.get_income_summary()
-        expenses_summary = data_loader.get_expenses_summary()
-        budget_comparison = data_loader.get_budget_vs_actual()
+        if wait_for_precompute():
+            return
+        
+        # Загрузка всех данных страницы одним обращением
+        bundle = data_loader.get_dashboard_bundle()
+        net_worth_summary = bundle['net_worth']
+        income_summary = bundle['income']
+        expenses_summary = bundle['expenses']
+        budget_comparison = bundle['budget']
         
         # Проверяем наличие данных
         if any(x is None for x in [net_worth_summary, income_summary, expenses_summary]):
@@ -94,7 +156,7 @@ def show_dashboard_page():
             show_mini_budget_comparison(budget_comparison)
             
     except Exception as e:
-        log_error(f"Ошибка при отображении дашборда: {str(e)}")
+        log_error("Ошибка при отображении дашборда: {}", e)
         st.error("Произошла ошибка при загрузке дашборда")
 
 def show_net_worth_page():
@@ -102,6 +164,9 @@ def show_net_worth_page():
     st.title("💰 Чистая стоимость")
     
     try:
+        if wait_for_precompute():
+            return
+        
         net_worth_data = data_loader.get_net_worth_summary()
         if not net_worth_data:
             st.warning("⚠️ Нет данных о чистой стоимости")
@@ -132,7 +197,7 @@ def show_net_worth_page():
         show_detailed_net_worth_chart(net_worth_data['history'])
         
     except Exception as e:
-        log_error(f"Ошибка при отбражении страницы чистой стоимости: {str(e)}")
+        log_error("Ошибка при отбражении страницы чистой стоимости: {}", e)
         st.error("Произошла ошибка при загрузке данных")
 
 def show_income_expenses_page():
@@ -140,8 +205,21 @@ def show_income_expenses_page():
     st.title("💵 Доходы и расходы")
     
     try:
-        income_data = data_loader.get_income_summary()
-        expenses_data = data_loader.get_expenses_summary()
+        if wait_for_precompute():
+            return
+        
+        # Смена периода пересчитывает только итоги по периодам из готовых агрегатов
+        period = st.radio(
+            "Группировка",
+            list(PERIOD_OPTIONS.keys()),
+            index=list(PERIOD_OPTIONS.keys()).index("month"),
+            format_func=lambda x: PERIOD_OPTIONS[x],
+            horizontal=True,
+            key="income_expenses_period"
+        )
+        
+        income_data = data_loader.get_income_summary(period)
+        expenses_data = data_loader.get_expenses_summary(period)
         
         if not income_data or not expenses_data:
             st.warning("⚠️ Нет данных о доходах и расходах")
@@ -171,8 +249,9 @@ def show_income_expenses_page():
         
         # Детальные графики
         show_detailed_income_expenses_chart(
-            income_data['monthly_history'],
-            expenses_data['monthly_history']
+            income_data['history'],
+            expenses_data['history'],
+            period
         )
         
         # Разбивка по источникам дохода и категориям расходов
@@ -181,45 +260,56 @@ def show_income_expenses_page():
             show_income_sources_chart(income_data['by_source'])
         with col2:
             show_expense_categories_chart(expenses_data['by_category'])
+        
+        show_category_drilldown(
+            'income', 'Source', income_data['by_source'].index,
+            income_data['monthly_history'], "Источник", ('Date', 'Amount')
+        )
             
     except Exception as e:
-        log_error(f"Ошибка при отображении страницы доходов и расходов: {str(e)}")
+        log_error("Ошибка при отображении страницы доходов и расходов: {}", e)
         st.error("Произошла ошибка при загрузке данных")
 
 def show_mini_net_worth_chart(df):
     """Мини-график чистой стоимости"""
     st.subheader("📈 Динамика чистой стоимости")
     
-    fig = go.Figure()
-    
-    # Добавляем линии для активов, обязательств и чистой стоимости
-    fig.add_trace(go.Scatter(
-        x=df['Date'],
-        y=df['Assets'],
-        name='Активы',
-        line=dict(color=CHART_COLORS['assets'])
-    ))
-    
-    fig.add_trace(go.Scatter(
-        x=df['Date'],
-        y=df['Liabilities'],
-        name='Обязательства',
-        line=dict(color=CHART_COLORS['liabilities'])
-    ))
-    
-    fig.add_trace(go.Scatter(
-        x=df['Date'],
-        y=df['NetWorth'],
-        name='Чистая стоимость',
-        line=dict(color=CHART_COLORS['net_worth'])
-    ))
-    
-    fig.update_layout(
-        height=400,
-        hovermode='x unified',
-        showlegend=True,
-        margin=dict(l=0, r=0, t=30, b=0)
-    )
+    def build(max_points):
+        fig = go.Figure()
+        # Точки выбираются один раз для всех линий графика
+        points = downsample_frame(df, 'Date', ['Assets', 'Liabilities', 'NetWorth'], max_points)
+        
+        # Добавляем линии для активов, обязательств и чистой стоимости
+        fig.add_trace(make_scatter(
+            x=points['Date'],
+            y=points['Assets'],
+            name='Активы',
+            line=dict(color=CHART_COLORS['assets'])
+        ))
+        
+        fig.add_trace(make_scatter(
+            x=points['Date'],
+            y=points['Liabilities'],
+            name='Обязательства',
+            line=dict(color=CHART_COLORS['liabilities'])
+        ))
+        
+        fig.add_trace(make_scatter(
+            x=points['Date'],
+            y=points['NetWorth'],
+            name='Чистая стоимость',
+            line=dict(color=CHART_COLORS['net_worth'])
+        ))
+        
+        fig.update_layout(
+            height=400,
+            hovermode='x unified',
+            showlegend=True,
+            margin=dict(l=0, r=0, t=30, b=0)
+        )
+        return fig
+    
+    fig = cached_figure('mini_net_worth', build)
     
     # Отображаем график без сохранения результата
     st.plotly_chart(fig, use_container_width=True)
@@ -244,29 +334,33 @@ def show_mini_income_expenses_chart(income_data, expenses_data):
     }).reset_index()
     df['Month'] = df['Month'].astype(str)
     
-    fig = go.Figure()
-    
-    # Добавляем столбцы доходов и расходов
-    fig.add_trace(go.Bar(
-        x=df['Month'],
-        y=df['Доходы'],
-        name='Доходы',
-        marker_color=CHART_COLORS['income']
-    ))
-    
-    fig.add_trace(go.Bar(
-        x=df['Month'],
-        y=df['Расходы'],
-        name='Расходы',
-        marker_color=CHART_COLORS['expenses']
-    ))
-    
-    fig.update_layout(
-        height=400,
-        barmode='group',
-        hovermode='x unified',
-        margin=dict(l=0, r=0, t=30, b=0)
-    )
+    def build(max_points):
+        fig = go.Figure()
+        
+        # Добавляем столбцы доходов и расходов
+        fig.add_trace(go.Bar(
+            x=df['Month'],
+            y=df['Доходы'],
+            name='Доходы',
+            marker_color=CHART_COLORS['income']
+        ))
+        
+        fig.add_trace(go.Bar(
+            x=df['Month'],
+            y=df['Расходы'],
+            name='Расходы',
+            marker_color=CHART_COLORS['expenses']
+        ))
+        
+        fig.update_layout(
+            height=400,
+            barmode='group',
+            hovermode='x unified',
+            margin=dict(l=0, r=0, t=30, b=0)
+        )
+        return fig
+    
+    fig = cached_figure('mini_income_expenses', build)
     
     # Отображаем график без сохранения результата
     st.plotly_chart(fig, use_container_width=True)
@@ -292,18 +386,22 @@ def show_mini_expense_breakdown(expenses_by_category):
     # Группируем мелкие категории
     main_categories = categorize_expenses(expenses_by_category)
     
-    fig = go.Figure(data=[go.Pie(
-        labels=main_categories.index,
-        values=main_categories.values,
-        hole=.4,
-        textinfo='percent+label'
-    )])
+    def build(max_points):
+        fig = go.Figure(data=[go.Pie(
+            labels=main_categories.index,
+            values=main_categories.values,
+            hole=.4,
+            textinfo='percent+label'
+        )])
+        
+        fig.update_layout(
+            height=400,
+            showlegend=False,
+            margin=dict(l=0, r=0, t=30, b=0)
+        )
+        return fig
     
-    fig.update_layout(
-        height=400,
-        showlegend=False,
-        margin=dict(l=0, r=0, t=30, b=0)
-    )
+    fig = cached_figure('mini_expense_breakdown', build)
     
     # Отображаем график без сохранения результата
     st.plotly_chart(fig, use_container_width=True)
@@ -324,29 +422,33 @@ def show_mini_budget_comparison(budget_data):
     """Мини-график сравнения бюджета с фактическими расходами"""
     st.subheader("📋 Бюджет vs Факт")
     
-    fig = go.Figure()
-    
-    # Добавляем столбцы бюджета и фактических расходов
-    fig.add_trace(go.Bar(
-        x=budget_data.index,
-        y=budget_data['Budget'],
-        name='Бюджет',
-        marker_color='rgba(46, 204, 113, 0.7)'
-    ))
-    
-    fig.add_trace(go.Bar(
-        x=budget_data.index,
-        y=budget_data['Actual'],
-        name='Факт',
-        marker_color='rgba(231, 76, 60, 0.7)'
-    ))
-    
-    fig.update_layout(
-        height=400,
-        barmode='group',
-        hovermode='x unified',
-        margin=dict(l=0, r=0, t=30, b=0)
-    )
+    def build(max_points):
+        fig = go.Figure()
+        
+        # Добавляем столбцы бюджета и фактических расходов
+        fig.add_trace(go.Bar(
+            x=budget_data.index,
+            y=budget_data['Budget'],
+            name='Бюджет',
+            marker_color='rgba(46, 204, 113, 0.7)'
+        ))
+        
+        fig.add_trace(go.Bar(
+            x=budget_data.index,
+            y=budget_data['Actual'],
+            name='Факт',
+            marker_color='rgba(231, 76, 60, 0.7)'
+        ))
+        
+        fig.update_layout(
+            height=400,
+            barmode='group',
+            hovermode='x unified',
+            margin=dict(l=0, r=0, t=30, b=0)
+        )
+        return fig
+    
+    fig = cached_figure('mini_budget_comparison', build)
     
     # Добавляем интерактивность
     selected_point = st.plotly_chart(fig, use_container_width=True)
@@ -387,43 +489,54 @@ def show_detailed_net_worth_chart(df):
             max_value=df['Date'].max()
         )
     
-    # Фильтруем данные
-    mask = (df['Date'] >= pd.Timestamp(start_date)) & (df['Date'] <= pd.Timestamp(end_date))
-    filtered_df = df[mask]
+    # Период читается запросом: из закэшированного листа бинарным поиском
+    # или из хранилища с передачей условия по дате
+    filtered_df = data_loader.get_date_range('net_worth', start_date, end_date)
+    if filtered_df is None or filtered_df.empty:
+        st.info("Нет данных за выбранный период")
+        return
+    filtered_df['NetWorth'] = (filtered_df['Assets'] - filtered_df['Liabilities']).round(2)
+    
+    # Создаем график; выбранный период прореживается до MAX_POINTS точек,
+    # поэтому узкий период показывается подробнее
+    def build(max_points):
+        fig = go.Figure()
+        # Общие точки для всех линий: заливки tonexty строятся между одинаковыми x
+        points = downsample_frame(filtered_df, 'Date', ['Assets', 'Liabilities', 'NetWorth'], max_points)
+        
+        fig.add_trace(make_scatter(
+            x=points['Date'],
+            y=points['Assets'],
+            name='Активы',
+            fill='tonexty',
+            line=dict(color=CHART_COLORS['assets'])
+        ))
+        
+        fig.add_trace(make_scatter(
+            x=points['Date'],
+            y=points['Liabilities'],
+            name='Обязательства',
+            fill='tonexty',
+            line=dict(color=CHART_COLORS['liabilities'])
+        ))
+        
+        fig.add_trace(make_scatter(
+            x=points['Date'],
+            y=points['NetWorth'],
+            name='Чистая стоимость',
+            line=dict(color=CHART_COLORS['net_worth'], width=3)
+        ))
+        
+        fig.update_layout(
+            height=500,
+            hovermode='x unified',
+            showlegend=True,
+            yaxis_title="Сумма",
+            xaxis_title="Дата"
+        )
+        return fig
     
-    # Создаем график
-    fig = go.Figure()
-    
-    fig.add_trace(go.Scatter(
-        x=filtered_df['Date'],
-        y=filtered_df['Assets'],
-        name='Активы',
-        fill='tonexty',
-        line=dict(color=CHART_COLORS['assets'])
-    ))
-    
-    fig.add_trace(go.Scatter(
-        x=filtered_df['Date'],
-        y=filtered_df['Liabilities'],
-        name='Обязательства',
-        fill='tonexty',
-        line=dict(color=CHART_COLORS['liabilities'])
-    ))
-    
-    fig.add_trace(go.Scatter(
-        x=filtered_df['Date'],
-        y=filtered_df['NetWorth'],
-        name='Чистая стоимость',
-        line=dict(color=CHART_COLORS['net_worth'], width=3)
-    ))
-    
-    fig.update_layout(
-        height=500,
-        hovermode='x unified',
-        showlegend=True,
-        yaxis_title="Сумма",
-        xaxis_title="Дата"
-    )
+    fig = cached_figure('detailed_net_worth', build, start_date, end_date)
     
     selected_point = st.plotly_chart(fig, use_container_width=True)
     
@@ -438,8 +551,8 @@ def show_detailed_net_worth_chart(df):
         - Предыдущее значение: {format_currency(trend['previous'])}
         """)
 
-def show_detailed_income_expenses_chart(income_data, expenses_data):
-    """Детальный график доходов и расходов"""
+def show_detailed_income_expenses_chart(income_data, expenses_data, period='month'):
+    """Детальный график доходов и расходов по выбранным периодам"""
     st.subheader("📊 Детальный анализ доходов и расходов")
     
     try:
@@ -450,63 +563,67 @@ def show_detailed_income_expenses_chart(income_data, expenses_data):
         }).reset_index()
         
         # Преобразуем Period в строку для корректного отображения
-        df['Month'] = df['Month'].astype(str)
+        df['Period'] = df['Period'].astype(str)
         
-        # Добавляем фильтры периода
-        months = df['Month'].unique().tolist()
+        # Добавляем фильтры периода; периоды уже упорядочены, выбирается позиция
+        periods = df['Period'].tolist()
         col1, col2 = st.columns(2)
         with col1:
-            start_month = st.selectbox(
-                "Начальный месяц",
-                options=months,
-                index=0
+            start_idx = st.selectbox(
+                "Начальный период",
+                options=range(len(periods)),
+                index=0,
+                format_func=lambda i: periods[i]
             )
         with col2:
-            end_month = st.selectbox(
-                "Конечный месяц",
-                options=months,
-                index=len(months)-1
+            end_idx = st.selectbox(
+                "Конечный период",
+                options=range(len(periods)),
+                index=len(periods)-1,
+                format_func=lambda i: periods[i]
             )
         
-        # Фильтруем данные
-        start_idx = months.index(start_month)
-        end_idx = months.index(end_month)
+        # Фильтруем данные срезом по позициям
         filtered_df = df.iloc[start_idx:end_idx+1]
         
         # Создаем график
-        fig = go.Figure()
-        
-        # Добавляем линии доходов и расходов
-        fig.add_trace(go.Scatter(
-            x=filtered_df['Month'],
-            y=filtered_df['Доходы'],
-            name='Доходы',
-            line=dict(color=CHART_COLORS['income'], width=3)
-        ))
-        
-        fig.add_trace(go.Scatter(
-            x=filtered_df['Month'],
-            y=filtered_df['Расходы'],
-            name='Расходы',
-            line=dict(color=CHART_COLORS['expenses'], width=3)
-        ))
+        def build(max_points):
+            fig = go.Figure()
+            
+            # Добавляем линии доходов и расходов
+            fig.add_trace(make_scatter(
+                x=filtered_df['Period'],
+                y=filtered_df['Доходы'],
+                name='Доходы',
+                line=dict(color=CHART_COLORS['income'], width=3)
+            ))
+            
+            fig.add_trace(make_scatter(
+                x=filtered_df['Period'],
+                y=filtered_df['Расходы'],
+                name='Расходы',
+                line=dict(color=CHART_COLORS['expenses'], width=3)
+            ))
+            
+            # Добавляем область между доходами и расходами
+            fig.add_trace(make_scatter(
+                x=filtered_df['Period'],
+                y=filtered_df['Доходы'] - filtered_df['Расходы'],
+                name='Баланс',
+                fill='tonexty',
+                line=dict(color='rgba(0,100,0,0.3)')
+            ))
+            
+            fig.update_layout(
+                height=500,
+                hovermode='x unified',
+                showlegend=True,
+                yaxis_title="Сумма",
+                xaxis_title=PERIOD_OPTIONS.get(period, "Период")
+            )
+            return fig
         
-        # Добавляем область между доходами и расходами
-        fig.add_trace(go.Scatter(
-            x=filtered_df['Month'],
-            y=filtered_df['Доходы'] - filtered_df['Расходы'],
-            name='Баланс',
-            fill='tonexty',
-            line=dict(color='rgba(0,100,0,0.3)')
-        ))
-        
-        fig.update_layout(
-            height=500,
-            hovermode='x unified',
-            showlegend=True,
-            yaxis_title="Сумма",
-            xaxis_title="Месяц"
-        )
+        fig = cached_figure('detailed_income_expenses', build, period, start_idx, end_idx)
         
         selected_point = st.plotly_chart(fig, use_container_width=True)
         
@@ -518,14 +635,14 @@ def show_detailed_income_expenses_chart(income_data, expenses_data):
             avg_income = filtered_df['Доходы'].mean()
             avg_expenses = filtered_df['Расходы'].mean()
             st.metric(
-                "Средний месячный доход",
+                "Средний доход за период",
                 format_currency(avg_income),
                 f"{((filtered_df['Доходы'].iloc[-1] / avg_income - 1) * 100):+.1f}% к среднему"
             )
         
         with col2:
             st.metric(
-                "Средние месячные расходы",
+                "Средние расходы за период",
                 format_currency(avg_expenses),
                 f"{((filtered_df['Расходы'].iloc[-1] / avg_expenses - 1) * 100):+.1f}% к среднему"
             )
@@ -535,8 +652,8 @@ def show_detailed_income_expenses_chart(income_data, expenses_data):
             st.metric("Средняя норма сбережений", f"{savings_rate:.1f}%")
 
     except Exception as e:
-        log_error(f"Ошибка при отображении страницы доходов и расходов: {str(e)}")
-        st.error("Произошла ошибка при загру��ке данных")
+        log_error("Ошибка при отображении страницы доходов и расходов: {}", e)
+        st.error("Произошла ошибка при загрузке данных")
 
 def show_income_sources_chart(income_by_source):
     """График источников дохода"""
@@ -546,19 +663,23 @@ def show_income_sources_chart(income_by_source):
     income_by_source_sorted = income_by_source.sort_values(ascending=True)
     
     # Создаем график
-    fig = go.Figure(go.Bar(
-        x=income_by_source_sorted.values,
-        y=income_by_source_sorted.index,
-        orientation='h',
-        marker_color=CHART_COLORS['income']
-    ))
-    
-    fig.update_layout(
-        height=400,
-        margin=dict(l=0, r=0, t=30, b=0),
-        xaxis_title="Сумма",
-        yaxis_title="Источник"
-    )
+    def build(max_points):
+        fig = go.Figure(go.Bar(
+            x=income_by_source_sorted.values,
+            y=income_by_source_sorted.index,
+            orientation='h',
+            marker_color=CHART_COLORS['income']
+        ))
+        
+        fig.update_layout(
+            height=400,
+            margin=dict(l=0, r=0, t=30, b=0),
+            xaxis_title="Сумма",
+            yaxis_title="Источник"
+        )
+        return fig
+    
+    fig = cached_figure('income_sources', build)
     
     selected_point = st.plotly_chart(fig, use_container_width=True)
     
@@ -579,19 +700,23 @@ def show_expense_categories_chart(expenses_by_category):
     main_categories = categorize_expenses(expenses_by_category)
     
     # Создаем круговую диаграмму
-    fig = go.Figure(data=[go.Pie(
-        labels=main_categories.index,
-        values=main_categories.values,
-        hole=.4,
-        textinfo='percent+label',
-        marker=dict(colors=px.colors.qualitative.Set3)
-    )])
-    
-    fig.update_layout(
-        height=500,
-        showlegend=True,
-        margin=dict(l=0, r=0, t=30, b=0)
-    )
+    def build(max_points):
+        fig = go.Figure(data=[go.Pie(
+            labels=main_categories.index,
+            values=main_categories.values,
+            hole=.4,
+            textinfo='percent+label',
+            marker=dict(colors=px.colors.qualitative.Set3)
+        )])
+        
+        fig.update_layout(
+            height=500,
+            showlegend=True,
+            margin=dict(l=0, r=0, t=30, b=0)
+        )
+        return fig
+    
+    fig = cached_figure('expense_categories', build)
     
     selected_point = st.plotly_chart(fig, use_container_width=True)
     
@@ -604,11 +729,99 @@ def show_expense_categories_chart(expenses_by_category):
     - Количество категорий: {len(expenses_by_category)}
     """)
 
+def show_category_stack_chart():
+    """Структура расходов по месяцам с группировкой мелких категорий каждого месяца"""
+    st.subheader("📊 Структура расходов по месяцам")
+    
+    matrix = data_loader.expense_matrix()
+    if matrix is None or matrix.empty:
+        st.info("Нет данных о расходах по месяцам")
+        return
+    
+    def build(max_points):
+        # Правило порога применяется ко всем месяцам сразу, без цикла по периодам
+        categories = categorize_expenses_matrix(matrix.drop(columns='Итого'))
+        months = categories.index.astype(str)
+        colors = px.colors.qualitative.Set3
+        
+        fig = go.Figure()
+        for i, category in enumerate(categories.columns):
+            fig.add_trace(go.Bar(
+                x=months,
+                y=categories[category],
+                name=category,
+                marker_color=colors[i % len(colors)]
+            ))
+        
+        fig.update_layout(
+            barmode='stack',
+            height=450,
+            hovermode='x unified',
+            showlegend=True,
+            yaxis_title="Сумма",
+            xaxis_title="Месяц",
+            margin=dict(l=0, r=0, t=30, b=0)
+        )
+        return fig
+    
+    fig = cached_figure('expense_category_stack', build)
+    st.plotly_chart(fig, use_container_width=True)
+
+def show_category_drilldown(data_type, dimension, categories, monthly_history, label, columns):
+    """Помесячные суммы и операции выбранной категории (источника) за период"""
+    st.subheader(f"🔎 {label} за период")
+    
+    first_day = monthly_history.index.min().start_time.date()
+    last_day = monthly_history.index.max().end_time.date()
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        selected = st.selectbox(label, list(categories), key=f"{data_type}_drilldown_category")
+    with col2:
+        start_date = st.date_input(
+            "Начальная дата", value=first_day, min_value=first_day, max_value=last_day,
+            key=f"{data_type}_drilldown_start"
+        )
+    with col3:
+        end_date = st.date_input(
+            "Конечная дата", value=last_day, min_value=first_day, max_value=last_day,
+            key=f"{data_type}_drilldown_end"
+        )
+    
+    # Период и категория передаются в хранилище, читаются только нужные строки и колонки
+    query = data_loader.query(data_type).between(start_date, end_date).where(**{dimension: selected})
+    monthly = query.group_by('month').execute()
+    if monthly is None or monthly.empty:
+        st.info("Нет операций за выбранный период")
+        return
+    
+    def build(max_points):
+        fig = go.Figure(go.Bar(
+            x=monthly['Month'],
+            y=monthly['Amount'],
+            marker_color=CHART_COLORS[data_type]
+        ))
+        fig.update_layout(
+            height=350,
+            margin=dict(l=0, r=0, t=30, b=0),
+            yaxis_title="Сумма",
+            xaxis_title="Месяц"
+        )
+        return fig
+    
+    fig = cached_figure(f'{data_type}_drilldown', build, selected, start_date, end_date)
+    st.plotly_chart(fig, use_container_width=True)
+    
+    operations = query.columns(*columns).execute()
+    st.dataframe(operations, use_container_width=True, hide_index=True)
+
 def show_expense_breakdown_page():
     """Страница разбивки расходов"""
     st.title("💸 Разбивка расходов")
     
     try:
+        if wait_for_precompute():
+            return
+        
         expenses_data = data_loader.get_expenses_summary()
         if expenses_data is None:
             st.warning("⚠️ Нет данных о расходах")
@@ -651,13 +864,18 @@ def show_expense_breakdown_page():
         
         # Детальные графики
         show_expense_categories_chart(expenses_data['by_category'])
+        show_category_stack_chart()
+        show_category_drilldown(
+            'expenses', 'Category', expenses_data['by_category'].index,
+            expenses_data['monthly_history'], "Категория", ('Date', 'Description', 'Amount')
+        )
         
         # График трендов по месяцам
         st.subheader("📈 Тренды расходов по месяцам")
-        show_detailed_expense_trends(expenses_data['monthly_history'])
+        show_detailed_expense_trends(expenses_data['monthly_history'], data_loader.get_expense_trends())
         
     except Exception as e:
-        log_error(f"Ошибка при отображении страницы расходов: {str(e)}")
+        log_error("Ошибка при отображении страницы расходов: {}", e)
         st.error("Произошла ошибка при загрузке данных")
 
 def show_budget_page():
@@ -665,6 +883,9 @@ def show_budget_page():
     st.title("📊 Бюджет")
     
     try:
+        if wait_for_precompute():
+            return
+        
         budget_data = data_loader.get_budget_vs_actual()
         if budget_data is None:
             st.warning("⚠️ Нет данных о бюджете")
@@ -701,7 +922,7 @@ def show_budget_page():
         show_budget_variance_analysis(budget_data)
         
     except Exception as e:
-        log_error(f"Ошибка при отображении страницы бюджета: {str(e)}")
+        log_error("Ошибка при отображении страницы бюджета: {}", e)
         st.error("Произошла ошибка при загрузке данных")
 
 def show_detailed_budget_comparison(budget_data):
@@ -709,29 +930,33 @@ def show_detailed_budget_comparison(budget_data):
     st.subheader("📊 Сравнение бюджета и фактических расходов")
     
     # Создаем столбчатую даграмму
-    fig = go.Figure()
-    
-    fig.add_trace(go.Bar(
-        name='Бюджет',
-        x=budget_data.index,
-        y=budget_data['Budget'],
-        marker_color='rgba(46, 204, 113, 0.7)'
-    ))
-    
-    fig.add_trace(go.Bar(
-        name='Факт',
-        x=budget_data.index,
-        y=budget_data['Actual'],
-        marker_color='rgba(231, 76, 60, 0.7)'
-    ))
-    
-    fig.update_layout(
-        barmode='group',
-        height=500,
-        margin=dict(l=0, r=0, t=30, b=0),
-        xaxis_title="Категория",
-        yaxis_title="Сумма"
-    )
+    def build(max_points):
+        fig = go.Figure()
+        
+        fig.add_trace(go.Bar(
+            name='Бюджет',
+            x=budget_data.index,
+            y=budget_data['Budget'],
+            marker_color='rgba(46, 204, 113, 0.7)'
+        ))
+        
+        fig.add_trace(go.Bar(
+            name='Факт',
+            x=budget_data.index,
+            y=budget_data['Actual'],
+            marker_color='rgba(231, 76, 60, 0.7)'
+        ))
+        
+        fig.update_layout(
+            barmode='group',
+            height=500,
+            margin=dict(l=0, r=0, t=30, b=0),
+            xaxis_title="Категория",
+            yaxis_title="Сумма"
+        )
+        return fig
+    
+    fig = cached_figure('detailed_budget_comparison', build)
     
     st.plotly_chart(fig, use_container_width=True)
 
@@ -747,22 +972,26 @@ def show_budget_variance_analysis(budget_data):
     analysis = analysis.sort_values('VariancePercent', ascending=True)
     
     # Создаем график отклонений
-    fig = go.Figure()
-    
-    colors = ['red' if x > 0 else 'green' for x in analysis['VariancePercent']]
-    
-    fig.add_trace(go.Bar(
-        x=analysis.index,
-        y=analysis['VariancePercent'],
-        marker_color=colors
-    ))
+    def build(max_points):
+        fig = go.Figure()
+        
+        colors = ['red' if x > 0 else 'green' for x in analysis['VariancePercent']]
+        
+        fig.add_trace(go.Bar(
+            x=analysis.index,
+            y=analysis['VariancePercent'],
+            marker_color=colors
+        ))
+        
+        fig.update_layout(
+            height=400,
+            margin=dict(l=0, r=0, t=30, b=0),
+            xaxis_title="Категория",
+            yaxis_title="Отклонение (%)"
+        )
+        return fig
     
-    fig.update_layout(
-        height=400,
-        margin=dict(l=0, r=0, t=30, b=0),
-        xaxis_title="Категория",
-        yaxis_title="Отклонение (%)"
-    )
+    fig = cached_figure('budget_variance', build)
     
     st.plotly_chart(fig, use_container_width=True)
     
@@ -784,39 +1013,73 @@ def show_budget_variance_analysis(budget_data):
         - {under_budget.index[1] if len(under_budget) > 1 else 'Нет'}: {under_budget['VariancePercent'].iloc[1]:.1f}% (если есть)
         """)
 
-def show_detailed_expense_trends(monthly_expenses):
+def show_detailed_expense_trends(monthly_expenses, trends=None):
     """График трендов расходов по месяцам"""
     try:
         # Создаем DataFrame для графика
         df = monthly_expenses.reset_index()
+        # Скользящие статистики рассчитаны заранее по всей истории, до выбора периода
+        if trends is not None:
+            statistics = trends.statistics()
+            df['Trend'] = statistics['sma']['Итого'].reindex(monthly_expenses.index).values
+            df['EWMA'] = statistics['ewma']['Итого'].reindex(monthly_expenses.index).values
+        else:
+            df['Trend'] = df['Amount'].rolling(window=TREND_CONFIG["WINDOW"], min_periods=1).mean()
         df['Month'] = df['Month'].astype(str)
         
-        fig = go.Figure()
-        
-        # Добавляем линию расходов
-        fig.add_trace(go.Scatter(
-            x=df['Month'],
-            y=df['Amount'],
-            name='Расходы',
-            line=dict(color=CHART_COLORS['expenses'], width=2)
-        ))
+        # Выбор периода: при сужении диапазона ряд прореживается слабее
+        months = df['Month'].tolist()
+        start_idx, end_idx = 0, len(months) - 1
+        if len(months) > 1:
+            start_idx, end_idx = st.select_slider(
+                "Период",
+                options=range(len(months)),
+                value=(start_idx, end_idx),
+                format_func=lambda i: months[i],
+                key="expense_trends_range"
+            )
+        period_df = df.iloc[start_idx:end_idx+1]
         
-        # Добавляем скользящее среднее
-        rolling_mean = df['Amount'].rolling(window=3, min_periods=1).mean()
-        fig.add_trace(go.Scatter(
-            x=df['Month'],
-            y=rolling_mean,
-            name='Тренд (3 месяца)',
-            line=dict(color='rgba(255, 165, 0, 0.7)', width=2, dash='dash')
-        ))
+        def build(max_points):
+            fig = go.Figure()
+            columns = [column for column in ('Amount', 'Trend', 'EWMA') if column in period_df]
+            points = downsample_frame(period_df, 'Month', columns, max_points)
+            
+            # Добавляем линию расходов
+            fig.add_trace(make_scatter(
+                x=points['Month'],
+                y=points['Amount'],
+                name='Расходы',
+                line=dict(color=CHART_COLORS['expenses'], width=2)
+            ))
+            
+            # Добавляем скользящее среднее
+            fig.add_trace(make_scatter(
+                x=points['Month'],
+                y=points['Trend'],
+                name=f'Тренд ({TREND_CONFIG["WINDOW"]} мес.)',
+                line=dict(color='rgba(255, 165, 0, 0.7)', width=2, dash='dash')
+            ))
+            
+            # Экспоненциальное сглаживание сильнее реагирует на последние месяцы
+            if 'EWMA' in period_df:
+                fig.add_trace(make_scatter(
+                    x=points['Month'],
+                    y=points['EWMA'],
+                    name=f'EWMA ({TREND_CONFIG["EWMA_SPAN"]} мес.)',
+                    line=dict(color='rgba(128, 0, 128, 0.6)', width=2, dash='dot')
+                ))
+            
+            fig.update_layout(
+                height=400,
+                hovermode='x unified',
+                showlegend=True,
+                yaxis_title="Сумма",
+                xaxis_title="Месяц"
+            )
+            return fig
         
-        fig.update_layout(
-            height=400,
-            hovermode='x unified',
-            showlegend=True,
-            yaxis_title="Сумма",
-            xaxis_title="Месяц"
-        )
+        fig = cached_figure('expense_trends', build, start_idx, end_idx)
         
         st.plotly_chart(fig, use_container_width=True)
         
@@ -834,7 +1097,7 @@ def show_detailed_expense_trends(monthly_expenses):
                 st.info("ℹ️ Расходы остались на том же уровне")
                 
     except Exception as e:
-        log_error(f"Ошибка при отображении трендов расходов: {str(e)}")
+        log_error("Ошибка при отображении трендов расходов: {}", e)
         st.error("Не удалось отобразить тренды расходов")
 
 # ... продожение следует ... 
\ No newline at end of file
@@ -1,23 +1,108 @@
+import copy
+import hashlib
+import io
+import multiprocessing
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import openpyxl
 import pandas as pd
+import pyarrow as pa
 import streamlit as st
 from pathlib import Path
+from config import CACHE_CONFIG, INGEST_CONFIG, JOBS_CONFIG, STORAGE_BACKEND, TREND_CONFIG
 from utils.logger import log_info, log_error, log_debug, log_warning
+from utils.storage import ParquetStore, SQLiteStore
+from utils.cache import SnapshotCache
+from utils.jobs import JobRunner
+from utils.query import Query
+from utils.data_processor import (
+    grouped_sum,
+    resample_rollup,
+    PERIOD_FREQUENCIES,
+    combine_rollups,
+    to_minor_units,
+    from_minor_units,
+    slice_by_date,
+    RollingStatistics
+)
 
 # Определяем пути для сохранения данных
 DATA_DIR = Path("data")
 DATA_DIR.mkdir(exist_ok=True)
 
+# Схема типов колонок, применяемая к каждому листу при загрузке.
+# Категории и источники хранятся как categorical, описания - как строки Arrow,
+# идентификаторы - как компактные беззнаковые целые, суммы - как целые копейки.
+SHEET_SCHEMAS = {
+    'net_worth': {
+        'Date': 'datetime64[ns]',
+        'Assets': 'Int64',
+        'Liabilities': 'Int64'
+    },
+    'income': {
+        'IncomeID': 'uint32',
+        'Date': 'datetime64[ns]',
+        'Source': 'category',
+        'Amount': 'Int64'
+    },
+    'expenses': {
+        'ExpenseID': 'uint32',
+        'Date': 'datetime64[ns]',
+        'Category': 'category',
+        'Description': 'string[pyarrow]',
+        'Amount': 'Int64'
+    },
+    'budget': {
+        'Category': 'category',
+        'BudgetAmount': 'Int64'
+    }
+}
+
 class DataLoader:
     """Класс для загрузки и обработки финансовых данных"""
     
     def __init__(self):
+        # Рабочие данные хранятся в Parquet, XLSX нужен только для переноса старых установок
         self.data_file = DATA_DIR / "financial_data.xlsx"
+        if STORAGE_BACKEND == "sqlite":
+            self.store = SQLiteStore(DATA_DIR / "finance.db")
+        else:
+            self.store = ParquetStore(DATA_DIR / "store")
+        # Общий для всех сессий кэш разобранных таблиц и сводок
+        self.cache = SnapshotCache(CACHE_CONFIG["MAX_BYTES"])
+        # Фоновый расчет сводок для всех страниц после загрузки данных
+        self.jobs = JobRunner(JOBS_CONFIG["MAX_WORKERS"])
+        # Загрузки и добавления данных выполняются строго по очереди
+        self.ingest_lock = threading.RLock()
+        # Пул процессов для параллельного разбора листов создается при первом использовании
+        self.parse_pool = None
         self.sheet_names = {
             'net_worth': 'Net Worth',
             'income': 'Income',
             'expenses': 'Expenses',
             'budget': 'Budget'
         }
+        # Ключевые колонки листов, которые можно дополнять новыми строками
+        self.id_columns = {
+            'income': 'IncomeID',
+            'expenses': 'ExpenseID'
+        }
+        # Листы-временные ряды хранятся отсортированными по дате
+        self.time_series = ['net_worth', 'income', 'expenses']
+        # Денежные колонки листов (в хранилище - целые копейки)
+        self.money_columns = {
+            'net_worth': ['Assets', 'Liabilities'],
+            'income': ['Amount'],
+            'expenses': ['Amount'],
+            'budget': ['BudgetAmount']
+        }
+        # Измерения, по которым при загрузке материализуются помесячные агрегаты
+        self.rollup_dimensions = {
+            'income': 'Source',
+            'expenses': 'Category'
+        }
     
     def validate_net_worth_data(self, df):
         """Проверка данных о чистой стоимости"""
@@ -27,8 +112,8 @@ class DataLoader:
         
         # Проверка типов данных
         df['Date'] = pd.to_datetime(df['Date'])
-        df['Assets'] = pd.to_numeric(df['Assets'])
-        df['Liabilities'] = pd.to_numeric(df['Liabilities'])
+        df['Assets'] = to_minor_units(df['Assets'])
+        df['Liabilities'] = to_minor_units(df['Liabilities'])
         return df
 
     def validate_income_data(self, df):
@@ -38,7 +123,7 @@ class DataLoader:
             raise ValueError(f"Отсутствуют обязательные колонки: {required_columns}")
         
         df['Date'] = pd.to_datetime(df['Date'])
-        df['Amount'] = pd.to_numeric(df['Amount'])
+        df['Amount'] = to_minor_units(df['Amount'])
         return df
 
     def validate_expenses_data(self, df):
@@ -48,7 +133,7 @@ class DataLoader:
             raise ValueError(f"Отсутствуют обязательные колонки: {required_columns}")
         
         df['Date'] = pd.to_datetime(df['Date'])
-        df['Amount'] = pd.to_numeric(df['Amount'])
+        df['Amount'] = to_minor_units(df['Amount'])
         return df
 
     def validate_budget_data(self, df):
@@ -57,73 +142,612 @@ class DataLoader:
         if not all(col in df.columns for col in required_columns):
             raise ValueError(f"Отсутствуют обязательные колонки: {required_columns}")
         
-        df['BudgetAmount'] = pd.to_numeric(df['BudgetAmount'])
+        df['BudgetAmount'] = to_minor_units(df['BudgetAmount'])
         return df
 
-    def process_uploaded_file(self, uploaded_file):
-        """Обработка загруженного файла"""
-        try:
+    def make_version(self, uploaded_file):
+        """Уникальная версия данных: время загрузки в наносекундах и хэш содержимого файла"""
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: uploaded_file.read(1024 * 1024), b""):
+            digest.update(chunk)
+        uploaded_file.seek(0)
+        return f"{time.time_ns()}-{digest.hexdigest()[:12]}"
+
+    def data_version(self):
+        """Текущая версия данных, используемая как ключ кэша"""
+        return self.store.current_version()
+
+    def cached(self, name, compute, *args):
+        """Получение результата из кэша для текущей версии данных"""
+        version = self.data_version()
+        if version is None:
+            return compute()
+        return self.cache.get_or_compute((version, name) + args, compute)
+
+    def validate_sheet(self, sheet_key, df):
+        """Валидация данных в зависимости от типа листа и приведение к схеме типов"""
+        if sheet_key == 'net_worth':
+            df = self.validate_net_worth_data(df)
+        elif sheet_key == 'income':
+            df = self.validate_income_data(df)
+        elif sheet_key == 'expenses':
+            df = self.validate_expenses_data(df)
+        elif sheet_key == 'budget':
+            df = self.validate_budget_data(df)
+        df = self.apply_schema(sheet_key, df)
+        if sheet_key in self.time_series:
+            df = df.sort_values('Date', kind='stable', ignore_index=True)
+        return df
+
+    def apply_schema(self, sheet_key, df):
+        """Приведение колонок листа к типам из SHEET_SCHEMAS"""
+        for column, dtype in SHEET_SCHEMAS.get(sheet_key, {}).items():
+            if column not in df.columns or df[column].dtype == dtype:
+                continue
+            if dtype == 'Int64' and pd.api.types.is_float_dtype(df[column]):
+                # Снимки до перехода на копейки хранят суммы в рублях
+                df[column] = to_minor_units(df[column])
+            elif dtype == 'uint32':
+                ids = pd.to_numeric(df[column])
+                if ids.isna().any() or (ids % 1 != 0).any() or (ids < 0).any() or (ids > 2**32 - 1).any():
+                    raise ValueError(f"Колонка {column} должна содержать целые числа от 0 до {2**32 - 1}")
+                df[column] = ids.astype(dtype)
+            else:
+                df[column] = df[column].astype(dtype)
+        return df
+
+    def iter_sheet_batches(self, worksheet, sheet_key, batch_size, job=None):
+        """Чтение листа пакетами фиксированного размера с валидацией каждого пакета"""
+        # Размер листа в режиме read_only берется из его заголовка и служит оценкой
+        if worksheet.max_row:
+            self.report_progress(job, sheet_key, total_rows=max(worksheet.max_row - 1, 0))
+        rows = worksheet.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            raise ValueError(f"Лист {self.sheet_names[sheet_key]} пуст")
+        header = list(header)
+        while header and header[-1] is None:
+            header.pop()
+        columns = [str(name) for name in header]
+        
+        batch = []
+        yielded = False
+        parsed = 0
+        validated = 0
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            batch.append(row[:len(columns)])
+            parsed += 1
+            if len(batch) >= batch_size:
+                self.report_progress(job, sheet_key, rows_parsed=parsed)
+                df = self.validate_sheet(sheet_key, pd.DataFrame(batch, columns=columns))
+                validated += len(df)
+                self.report_progress(job, sheet_key, rows_validated=validated)
+                yield df
+                yielded = True
+                batch = []
+        
+        # Последний неполный пакет; для пустого листа сохраняем хотя бы заголовок
+        if batch or not yielded:
+            self.report_progress(job, sheet_key, rows_parsed=parsed)
+            df = self.validate_sheet(sheet_key, pd.DataFrame(batch, columns=columns))
+            self.report_progress(job, sheet_key, rows_validated=validated + len(df))
+            yield df
+
+    def add_rollup_partial(self, sheet_key, df, partials):
+        """Добавление частичного агрегата по очередной порции строк листа"""
+        dimension = self.rollup_dimensions.get(sheet_key)
+        # Хранилища без материализованных агрегатов группируют данные при запросе
+        if dimension is not None and self.store.materializes_rollups:
+            partials.setdefault(sheet_key, []).append(grouped_sum(df, ['Day', dimension]))
+
+    def collect_rollups(self, sheet_key, batches, partials):
+        """Накопление частичных агрегатов по мере чтения пакетов листа"""
+        for df in batches:
+            self.add_rollup_partial(sheet_key, df, partials)
+            yield df
+
+    def rollup_specs(self):
+        """Лист и колонки группировки для каждого агрегата"""
+        specs = {}
+        for sheet_key, dimension in self.rollup_dimensions.items():
+            specs[f'{sheet_key}_by_day_{dimension.lower()}'] = (sheet_key, ['Day', dimension])
+            specs[f'{sheet_key}_by_month_{dimension.lower()}'] = (sheet_key, ['Month', dimension])
+            specs[f'{sheet_key}_by_month'] = (sheet_key, ['Month'])
+            specs[f'{sheet_key}_by_{dimension.lower()}'] = (sheet_key, [dimension])
+        return specs
+
+    def build_rollups(self, partials):
+        """Материализация агрегатов: день×измерение, месяц×измерение, итоги по месяцам и по измерению"""
+        rollups = {}
+        for sheet_key, dimension in self.rollup_dimensions.items():
+            daily = combine_rollups(partials.get(sheet_key, []), ['Day', dimension])
+            rollups[f'{sheet_key}_by_day_{dimension.lower()}'] = daily
+            # Более крупные агрегаты выводятся из дневного без повторного просмотра операций
+            detail = resample_rollup(daily, 'month', [dimension], target='Month')
+            rollups[f'{sheet_key}_by_month_{dimension.lower()}'] = detail
+            rollups[f'{sheet_key}_by_month'] = combine_rollups([detail], ['Month'])
+            rollups[f'{sheet_key}_by_{dimension.lower()}'] = combine_rollups([detail], [dimension])
+        return rollups
+
+    def report_progress(self, job, sheet_key, **values):
+        """Обновление прогресса загрузки листа, если загрузка идет фоновой задачей"""
+        if job is not None:
+            job.update_progress(self.sheet_names[sheet_key], **values)
+
+    def start_progress(self, job, sheet_keys):
+        """Начальное состояние прогресса для всех загружаемых листов"""
+        for sheet_key in sheet_keys:
+            self.report_progress(
+                job, sheet_key, stage='pending', total_rows=None,
+                rows_parsed=0, rows_validated=0, bytes_written=0
+            )
+
+    def ingest_workbook(self, uploaded_file, version, job=None):
+        """Загрузка книги целиком: один разбор файла, все листы в памяти по очереди"""
+        partials = {}
+        with pd.ExcelFile(uploaded_file, engine='openpyxl') as xls:
             # Проверяем наличие всех необходимых листов
-            xls = pd.ExcelFile(uploaded_file)
             missing_sheets = set(self.sheet_names.values()) - set(xls.sheet_names)
+            if missing_sheets:
+                raise ValueError(f"Отсутствуют необходимые листы: {missing_sheets}")
             
+            # Читаем, валидируем и сразу сохраняем каждый лист в новый снимок
+            self.start_progress(job, self.sheet_names)
+            for sheet_key, sheet_name in self.sheet_names.items():
+                self.report_progress(job, sheet_key, stage='parsing')
+                df = xls.parse(sheet_name)
+                self.report_progress(job, sheet_key, total_rows=len(df), rows_parsed=len(df))
+                df = self.validate_sheet(sheet_key, df)
+                self.report_progress(job, sheet_key, rows_validated=len(df), stage='writing')
+                self.add_rollup_partial(sheet_key, df, partials)
+                self.store.write(sheet_key, df, version)
+                self.report_progress(
+                    job, sheet_key, stage='done',
+                    bytes_written=self.store.size(sheet_key, version)
+                )
+                log_debug("Лист {} обработан: {} строк", sheet_name, len(df))
+        return partials
+
+    def get_parse_pool(self):
+        """Пул процессов для разбора листов, общий для всех загрузок"""
+        if self.parse_pool is None:
+            # spawn: дочерние процессы не наследуют потоки Streamlit и пула задач
+            self.parse_pool = ProcessPoolExecutor(
+                max_workers=min(INGEST_CONFIG["PARALLEL_WORKERS"], len(self.sheet_names)),
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return self.parse_pool
+
+    def parse_sheet(self, content, sheet_key):
+        """Разбор и валидация одного листа книги целиком (выполняется в рабочем процессе)"""
+        # В режиме read_only openpyxl разбирает только XML запрошенного листа
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+        try:
+            worksheet = workbook[self.sheet_names[sheet_key]]
+            return next(self.iter_sheet_batches(worksheet, sheet_key, sys.maxsize))
+        finally:
+            workbook.close()
+
+    def ingest_workbook_parallel(self, uploaded_file, version, job=None):
+        """Загрузка книги с параллельным разбором листов в отдельных процессах"""
+        partials = {}
+        content = uploaded_file.read()
+        uploaded_file.seek(0)
+        workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+        try:
+            missing_sheets = set(self.sheet_names.values()) - set(workbook.sheetnames)
+        finally:
+            workbook.close()
+        if missing_sheets:
+            raise ValueError(f"Отсутствуют необходимые листы: {missing_sheets}")
+        
+        # Процессы возвращают уже типизированные таблицы, запись в снимок идет в основном процессе
+        self.start_progress(job, self.sheet_names)
+        pool = self.get_parse_pool()
+        futures = {}
+        for sheet_key in self.sheet_names:
+            futures[pool.submit(parse_sheet, content, sheet_key)] = sheet_key
+            self.report_progress(job, sheet_key, stage='parsing')
+        try:
+            for future in as_completed(futures):
+                sheet_key = futures[future]
+                df = future.result()
+                self.report_progress(
+                    job, sheet_key, stage='writing',
+                    total_rows=len(df), rows_parsed=len(df), rows_validated=len(df)
+                )
+                self.add_rollup_partial(sheet_key, df, partials)
+                self.store.write(sheet_key, df, version)
+                self.report_progress(
+                    job, sheet_key, stage='done',
+                    bytes_written=self.store.size(sheet_key, version)
+                )
+                log_debug("Лист {} обработан в отдельном процессе: {} строк", self.sheet_names[sheet_key], len(df))
+        finally:
+            for future in futures:
+                future.cancel()
+        return partials
+
+    def ingest_workbook_streaming(self, uploaded_file, version, job=None):
+        """Потоковая загрузка книги: пиковая память ограничена размером пакета"""
+        partials = {}
+        workbook = openpyxl.load_workbook(uploaded_file, read_only=True, data_only=True)
+        try:
+            missing_sheets = set(self.sheet_names.values()) - set(workbook.sheetnames)
             if missing_sheets:
                 raise ValueError(f"Отсутствуют необходимые листы: {missing_sheets}")
             
-            # Читаем и валидируем каждый лист
-            data_frames = {}
+            self.start_progress(job, self.sheet_names)
             for sheet_key, sheet_name in self.sheet_names.items():
-                df = pd.read_excel(uploaded_file, sheet_name=sheet_name)
+                self.report_progress(job, sheet_key, stage='parsing')
+                batches = self.iter_sheet_batches(
+                    workbook[sheet_name], sheet_key, INGEST_CONFIG["BATCH_SIZE"], job
+                )
+                batches = self.collect_rollups(sheet_key, batches, partials)
+                rows = self.store.write_batches(
+                    sheet_key, batches, version,
+                    on_batch=lambda size, key=sheet_key: self.report_progress(job, key, bytes_written=size)
+                )
+                self.report_progress(job, sheet_key, stage='done')
+                log_debug("Лист {} обработан потоково: {} строк", sheet_name, rows)
+        finally:
+            workbook.close()
+        return partials
+
+    def is_large_file(self, uploaded_file):
+        """Проверка, превышает ли файл порог потоковой загрузки"""
+        uploaded_file.seek(0, io.SEEK_END)
+        size = uploaded_file.tell()
+        uploaded_file.seek(0)
+        return size >= INGEST_CONFIG["STREAMING_THRESHOLD_BYTES"]
+
+    def start_upload(self, uploaded_file, mode='replace'):
+        """Запуск фоновой загрузки файла; задача хранит прогресс по каждому листу"""
+        if mode not in ('replace', 'append'):
+            raise ValueError(f"Неизвестный режим загрузки: {mode}")
+        # Содержимое копируется, так как объект загрузки Streamlit принадлежит сессии
+        buffer = io.BytesIO(uploaded_file.getvalue())
+        return self.jobs.submit(f'upload_{mode}', self.run_upload, buffer, mode)
+
+    def run_upload(self, job, uploaded_file, mode):
+        """Выполнение загрузки файла внутри фоновой задачи"""
+        if mode == 'append':
+            return self.append_uploaded_file(uploaded_file, job)
+        return self.process_uploaded_file(uploaded_file, job=job)
+
+    def process_uploaded_file(self, uploaded_file, streaming=None, job=None, parallel=None):
+        """Обработка загруженного файла
+        
+        При streaming=None потоковый режим включается автоматически для больших файлов.
+        При parallel=None листы разбираются параллельно, если в INGEST_CONFIG задано
+        больше одного процесса. Потоковый режим (явный или автоматический) имеет
+        приоритет: при нем parallel игнорируется.
+        """
+        # Загрузки выполняются по одной: параллельная фиксация снимка удалила бы чужой снимок
+        with self.ingest_lock:
+            version = None
+            try:
+                version = self.make_version(uploaded_file)
+                if streaming is None:
+                    streaming = self.is_large_file(uploaded_file)
+                if parallel is None:
+                    parallel = INGEST_CONFIG["PARALLEL_WORKERS"] > 1
                 
-                # Валидация данных в зависимости от типа листа
-                if sheet_key == 'net_worth':
-                    df = self.validate_net_worth_data(df)
-                elif sheet_key == 'income':
-                    df = self.validate_income_data(df)
-                elif sheet_key == 'expenses':
-                    df = self.validate_expenses_data(df)
-                elif sheet_key == 'budget':
-                    df = self.validate_budget_data(df)
+                self.store.begin_snapshot(version)
+                # Большие файлы разбираются потоково даже при явном parallel:
+                # целые листы не передаются между процессами
+                if streaming:
+                    log_info("Потоковая загрузка файла с финансовыми данными")
+                    partials = self.ingest_workbook_streaming(uploaded_file, version, job)
+                elif parallel:
+                    log_info("Параллельная загрузка файла с финансовыми данными")
+                    partials = self.ingest_workbook_parallel(uploaded_file, version, job)
+                else:
+                    partials = self.ingest_workbook(uploaded_file, version, job)
                 
-                data_frames[sheet_key] = df
-            
-            # Сохраняем все данные в один файл
-            with pd.ExcelWriter(self.data_file) as writer:
-                for sheet_key, df in data_frames.items():
-                    df.to_excel(writer, sheet_name=self.sheet_names[sheet_key], index=False)
+                # Агрегаты сохраняются в тот же снимок, что и исходные листы
+                if self.store.materializes_rollups:
+                    for name, rollup in self.build_rollups(partials).items():
+                        self.store.write(f"rollup_{name}", rollup, version)
+                
+                # Атомарно переключаем версию, записи кэша старой версии больше не используются
+                self.store.commit_snapshot(version)
+                self.cache.clear()
+                self.start_precompute(version)
+                
+                log_info("Файл с финансовыми данными успешно обработан и сохранен")
+                return True
+                
+            except Exception as e:
+                if version is not None:
+                    self.store.discard_snapshot(version)
+                log_error("Ошибка при обработке файла: {}", e)
+                raise
+
+    def append_uploaded_file(self, uploaded_file, job=None):
+        """Добавление новых доходов и расходов к уже загруженным данным
             
-            log_info("Файл с финансовыми данными успешно обработан и сохранен")
-            return True
+        Строки с уже известными IncomeID/ExpenseID пропускаются, агрегаты
+        обновляются по добавленным строкам без пересчета всей истории.
+        """
+        # Загрузки выполняются по одной, базовая версия не меняется до фиксации снимка
+        with self.ingest_lock:
+            base_version = self.data_version()
+            if base_version is None:
+                raise ValueError("Сначала загрузите полный файл с данными")
             
-        except Exception as e:
-            log_error(f"Ошибка при обработке файла: {str(e)}")
-            raise
+            version = None
+            try:
+                version = self.make_version(uploaded_file)
+                with pd.ExcelFile(uploaded_file, engine='openpyxl') as xls:
+                    append_sheets = {
+                        sheet_key: self.sheet_names[sheet_key]
+                        for sheet_key in self.id_columns
+                        if self.sheet_names[sheet_key] in xls.sheet_names
+                    }
+                    if not append_sheets:
+                        expected = [self.sheet_names[key] for key in self.id_columns]
+                        raise ValueError(f"Файл должен содержать хотя бы один из листов: {expected}")
+                    
+                    # Новый снимок ссылается на файлы текущего, меняются только агрегаты
+                    self.store.begin_snapshot(version, base_version, self.sheet_names.keys())
+                    
+                    partials = {}
+                    deltas = {}
+                    self.start_progress(job, append_sheets)
+                    for sheet_key, sheet_name in append_sheets.items():
+                        if pa.types.is_floating(self.store.schema(sheet_key, base_version).field('Amount').type):
+                            raise ValueError("Данные сохранены в устаревшем формате, загрузите полный файл заново")
+                        self.report_progress(job, sheet_key, stage='parsing')
+                        df = xls.parse(sheet_name)
+                        self.report_progress(job, sheet_key, total_rows=len(df), rows_parsed=len(df))
+                        df = self.validate_sheet(sheet_key, df)
+                        self.report_progress(job, sheet_key, rows_validated=len(df), stage='writing')
+                        delta = self.new_rows(sheet_key, df, base_version)
+                        if not delta.empty:
+                            size_before = self.store.size(sheet_key, version)
+                            self.store.append(sheet_key, delta, version)
+                            self.add_rollup_partial(sheet_key, delta, partials)
+                            self.report_progress(
+                                job, sheet_key,
+                                bytes_written=self.store.size(sheet_key, version) - size_before
+                            )
+                        self.report_progress(job, sheet_key, stage='done')
+                        deltas[sheet_key] = delta
+                        log_info("Лист {}: добавлено {} из {} строк", sheet_name, len(delta), len(df))
+                
+                if self.store.materializes_rollups:
+                    self.merge_rollups(partials, version)
+                # Снимок построен на base_version и не должен перекрыть более новую загрузку
+                if self.data_version() != base_version:
+                    raise RuntimeError(f"Данные изменились во время добавления (версия {base_version} устарела)")
+                self.store.commit_snapshot(version)
+                self.carry_cached_frames(base_version, version, deltas)
+                self.carry_expense_trends(base_version, version)
+                self.start_precompute(version)
+                
+                log_info("Новые данные успешно добавлены")
+                return {sheet_key: len(delta) for sheet_key, delta in deltas.items()}
+                
+            except Exception as e:
+                if version is not None:
+                    self.store.discard_snapshot(version)
+                log_error("Ошибка при добавлении данных: {}", e)
+                raise
+
+    def start_precompute(self, version):
+        """Запуск фонового расчета данных всех страниц для новой версии"""
+        return self.jobs.submit('precompute', self.precompute, version, job_id=f"precompute-{version}")
+
+    def precompute(self, job, version):
+        """Расчет сводок всех страниц и их одновременная публикация в кэш"""
+        net_worth = self.compute_net_worth_summary()
+        income = self.compute_income_summary('month')
+        expenses = self.compute_expenses_summary('month')
+        budget = self.compute_budget_vs_actual()
+        # Статистики могли быть перенесены из предыдущей версии при добавлении данных
+        trends = self.cache.get((version, 'expense_trends')) or self.compute_expense_trends()
+        
+        # Пока шел расчет, могла быть загружена новая версия данных
+        if self.data_version() != version:
+            log_debug("Версия {} устарела, результаты предварительного расчета отброшены", version)
+            return False
+        
+        results = {
+            (version, 'net_worth_summary'): net_worth,
+            (version, 'income_summary', 'month'): income,
+            (version, 'expenses_summary', 'month'): expenses,
+            (version, 'budget_vs_actual'): budget,
+            (version, 'expense_trends'): trends,
+            (version, 'dashboard_bundle'): {
+                'net_worth': net_worth,
+                'income': income,
+                'expenses': expenses,
+                'budget': budget
+            }
+        }
+        self.cache.put_many({key: value for key, value in results.items() if value is not None})
+        log_info("Данные страниц для версии {} рассчитаны заранее", version)
+        return True
+
+    def is_precomputing(self):
+        """Идет ли фоновый расчет данных страниц для текущей версии"""
+        job = self.jobs.get(f"precompute-{self.data_version()}")
+        return job is not None and not job.is_finished()
+
+    def new_rows(self, sheet_key, df, version):
+        """Отбор строк, идентификаторов которых еще нет в хранилище"""
+        id_column = self.id_columns[sheet_key]
+        existing_ids = self.store.read(sheet_key, columns=[id_column], version=version)[id_column]
+        df = df.drop_duplicates(subset=id_column)
+        return df[~df[id_column].isin(existing_ids)]
+
+    def merge_rollups(self, partials, version):
+        """Инкрементальное обновление агрегатов: текущие значения плюс добавленные строки"""
+        for sheet_key, dimension in self.rollup_dimensions.items():
+            daily = self.load_rollup(f'{sheet_key}_by_day_{dimension.lower()}')
+            partials[sheet_key] = [daily] + partials.get(sheet_key, [])
+        for name, rollup in self.build_rollups(partials).items():
+            self.store.write(f"rollup_{name}", rollup, version)
+
+    def carry_cached_frames(self, base_version, version, deltas):
+        """Перенос закэшированных листов в новую версию без повторного чтения"""
+        for sheet_key in self.sheet_names:
+            frame = self.cache.get((base_version, 'frame', sheet_key))
+            if frame is None:
+                continue
+            delta = deltas.get(sheet_key)
+            if delta is not None and not delta.empty:
+                frame = pd.concat([frame, delta.reindex(columns=frame.columns)], ignore_index=True)
+                frame = self.apply_schema(sheet_key, frame)
+                # Добавленные строки могут быть датированы раньше уже загруженных
+                if sheet_key in self.time_series and not frame['Date'].is_monotonic_increasing:
+                    frame = frame.sort_values('Date', kind='stable', ignore_index=True)
+            self.cache.put((version, 'frame', sheet_key), frame)
+
+    def carry_expense_trends(self, base_version, version):
+        """Перенос скользящих статистик в новую версию с пересчетом только измененных месяцев"""
+        engine = self.cache.get((base_version, 'expense_trends'))
+        if engine is None:
+            return
+        matrix = self.expense_matrix()
+        if matrix is None:
+            return
+        # Копия: экземпляр старой версии может читаться другими сессиями
+        engine = copy.copy(engine)
+        engine.update(matrix)
+        self.cache.put((version, 'expense_trends'), engine)
+
+    def export_to_excel(self):
+        """Экспорт текущих данных в Excel-файл (формируется по запросу)"""
+        def build():
+            buffer = io.BytesIO()
+            with pd.ExcelWriter(buffer, engine='openpyxl') as writer:
+                for sheet_key, sheet_name in self.sheet_names.items():
+                    df = self.load_data(sheet_key)
+                    money = self.money_columns[sheet_key]
+                    df[money] = from_minor_units(df[money])
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+            log_info("Сформирован Excel-файл для экспорта данных")
+            return buffer.getvalue()
+        
+        if self.data_version() is None:
+            return None
+        return self.cached('excel_export', build)
+
+    def migrate_legacy_excel(self):
+        """Однократный перенос данных из financial_data.xlsx в колоночное хранилище"""
+        if not self.data_file.exists():
+            return False
+        
+        log_info("Перенос данных из Excel-файла в колоночное хранилище")
+        with open(self.data_file, "rb") as file:
+            self.process_uploaded_file(file)
+        return True
 
     def load_data(self, data_type):
         """Загрузка данных определенного типа"""
         try:
-            if not self.data_file.exists():
-                log_warning("Файл с данными не найден")
-                return None
-            
             if data_type not in self.sheet_names:
                 raise ValueError("Неизвестный тип данных")
             
-            df = pd.read_excel(self.data_file, sheet_name=self.sheet_names[data_type])
-            log_debug(f"Загружены данные типа {data_type}")
-            return df
+            if not self.store.exists(data_type) and not self.migrate_legacy_excel():
+                log_warning("Файл с данными не найден")
+                return None
+            
+            df = self.cached('frame', lambda: self.read_frame(data_type), data_type)
+            # Поверхностная копия защищает общий экземпляр от добавления колонок
+            return df.copy(deep=False) if df is not None else None
             
         except Exception as e:
-            log_error(f"Ошибка при загрузке данных {data_type}: {str(e)}")
+            log_error("Ошибка при загрузке данных {}: {}", data_type, e)
+            return None
+
+    def read_frame(self, data_type):
+        """Чтение листа из хранилища без кэширования"""
+        df = self.apply_schema(data_type, self.store.read(data_type))
+        # Пакеты потоковой загрузки и добавленные части отсортированы только по отдельности
+        if data_type in self.time_series and not df['Date'].is_monotonic_increasing:
+            df = df.sort_values('Date', kind='stable', ignore_index=True)
+        log_debug("Загружены данные типа {}", data_type)
+        return df
+
+    def get_date_range(self, data_type, start=None, end=None):
+        """Строки листа за период [start, end] без построения булевой маски; суммы в рублях"""
+        if data_type not in self.time_series:
+            raise ValueError(f"Лист {data_type} не является временным рядом")
+        return self.query(data_type).between(start, end).execute()
+
+    def query(self, data_type):
+        """Ленивый запрос к листу с передачей колонок и условий в хранилище"""
+        if data_type not in self.sheet_names:
+            raise ValueError("Неизвестный тип данных")
+        return Query(self.execute_query, data_type, SHEET_SCHEMAS[data_type])
+
+    def execute_query(self, query):
+        """Выполнение запроса с кэшированием результата для текущей версии данных
+
+        Денежные колонки результата переводятся в рубли, как и во всех данных для страниц.
+        """
+        try:
+            if self.data_version() is None and not self.migrate_legacy_excel():
+                log_warning("Файл с данными не найден")
+                return None
+            df = self.cached('query', lambda: self.to_major_units(query.data_type, self.run_query(query)), query.key())
+            return df.copy(deep=False) if df is not None else None
+        except Exception as e:
+            log_error("Ошибка при выполнении запроса к {}: {}", query.data_type, e)
             return None
 
+    def to_major_units(self, data_type, df):
+        """Перевод денежных колонок листа, присутствующих в df, из копеек в рубли"""
+        money = [column for column in self.money_columns[data_type] if column in df.columns]
+        return df.assign(**{column: from_minor_units(df[column]) for column in money})
+
+    def run_query(self, query):
+        """Выполнение запроса без кэширования результата; суммы в целых копейках"""
+        frame = self.cache.get((self.data_version(), 'frame', query.data_type))
+        if frame is not None:
+            # Лист уже в памяти: условия применяются к нему без повторного чтения
+            df = frame
+            if query.start is not None or query.end is not None:
+                df = slice_by_date(df, query.start, query.end)
+            for column, values in query.filters.items():
+                df = df[df[column].isin(values)]
+        elif query.group_keys is not None and not self.store.materializes_rollups:
+            # Хранилище без материализованных агрегатов группирует данные само
+            return self.store.aggregate(
+                query.data_type, query.group_keys, query.value,
+                start=query.start, end=query.end, filters=query.filters
+            )
+        else:
+            df = self.store.read(
+                query.data_type, columns=query.needed_columns(),
+                start=query.start, end=query.end, filters=query.filters
+            )
+            df = self.apply_schema(query.data_type, df)
+            if 'Date' in df.columns and query.data_type in self.time_series and not df['Date'].is_monotonic_increasing:
+                df = df.sort_values('Date', kind='stable', ignore_index=True)
+        
+        if query.group_keys is not None:
+            return grouped_sum(df, query.group_keys, query.value)
+        return df[query.selected or query.available_columns]
+
     def get_net_worth_summary(self):
+        """Получение сводки по чистой стоимости (из общего кэша)"""
+        return self.cached('net_worth_summary', self.compute_net_worth_summary)
+
+    def compute_net_worth_summary(self):
         """Получение сводки по чистой стоимости"""
         df = self.load_data('net_worth')
         if df is None:
             return None
         
+        # Разность считается в копейках, в рубли переводятся только итоговые значения
         df['NetWorth'] = df['Assets'] - df['Liabilities']
+        df[['Assets', 'Liabilities', 'NetWorth']] = from_minor_units(df[['Assets', 'Liabilities', 'NetWorth']])
         latest = df.iloc[-1]
         return {
             'current_net_worth': latest['NetWorth'],
@@ -133,71 +757,220 @@ class DataLoader:
         }
 
     def get_income_summary(self, period='month'):
+        """Получение сводки по доходам (из общего кэша)"""
+        return self.cached('income_summary', lambda: self.compute_income_summary(period), period)
+
+    def load_rollup(self, name):
+        """Загрузка материализованного агрегата"""
+        def read():
+            if self.store.materializes_rollups and self.store.exists(f"rollup_{name}"):
+                rollup = self.store.read(f"rollup_{name}")
+                if pd.api.types.is_float_dtype(rollup['Amount']):
+                    rollup['Amount'] = to_minor_units(rollup['Amount'])
+                return rollup
+            # Хранилища без материализованных агрегатов и снимки, созданные до их появления:
+            # группировка запросом, читаются только нужные колонки
+            log_debug("Агрегат {} вычисляется запросом к исходным данным", name)
+            sheet_key, by = self.rollup_specs()[name]
+            return self.run_query(self.query(sheet_key).group_by(*by))
+        
+        if self.data_version() is None and not self.migrate_legacy_excel():
+            return None
+        return self.cached('rollup', read, name)
+
+    def load_period_rollup(self, sheet_key, period):
+        """Итоги листа по периодам, выведенные из более детальных агрегатов
+
+        Недели не укладываются в месяцы и строятся по дневному агрегату,
+        кварталы и годы - по месячному. Исходные операции не перечитываются.
+        """
+        if period not in PERIOD_FREQUENCIES:
+            raise ValueError(f"Неизвестный период: {period}")
+        
+        def build():
+            if period in ('day', 'week'):
+                dimension = self.rollup_dimensions[sheet_key]
+                source, column = self.load_rollup(f'{sheet_key}_by_day_{dimension.lower()}'), 'Day'
+            else:
+                source, column = self.load_rollup(f'{sheet_key}_by_month'), 'Month'
+            if source is None:
+                return None
+            return resample_rollup(source, period, source=column)
+        return self.cached('period_rollup', build, sheet_key, period)
+
+    def period_series(self, rollup, period, column='Period'):
+        """Агрегат по периодам в рублях в виде Series с периодами в индексе"""
+        return pd.Series(
+            from_minor_units(rollup['Amount']).values,
+            index=pd.PeriodIndex(rollup[column].dt.to_period(PERIOD_FREQUENCIES[period]), name=column),
+            name='Amount'
+        )
+
+    def monthly_series(self, rollup):
+        """Помесячный агрегат в рублях в виде Series с периодами в индексе"""
+        return self.period_series(rollup, 'month', column='Month')
+
+    def compute_income_summary(self, period='month'):
         """Получение сводки по доходам"""
-        df = self.load_data('income')
-        if df is None:
+        monthly = self.load_rollup('income_by_month')
+        by_source = self.load_rollup('income_by_source')
+        by_period = self.load_period_rollup('income', period)
+        if monthly is None or by_source is None or by_period is None:
             return None
         
-        df['Month'] = df['Date'].dt.to_period('M')
-        monthly_income = df.groupby('Month')['Amount'].sum()
+        # Итоги суммируются в целых копейках, в рубли переводится результат
+        total_minor = monthly['Amount'].sum()
         return {
-            'total_income': df['Amount'].sum(),
-            'average_monthly': monthly_income.mean(),
-            'by_source': df.groupby('Source')['Amount'].sum(),
-            'monthly_history': monthly_income
+            'total_income': from_minor_units(total_minor),
+            'average_monthly': from_minor_units(total_minor) / len(monthly) if len(monthly) else float('nan'),
+            'average_per_period': from_minor_units(total_minor) / len(by_period) if len(by_period) else float('nan'),
+            'by_source': from_minor_units(by_source.set_index('Source')['Amount']),
+            'monthly_history': self.monthly_series(monthly),
+            'history': self.period_series(by_period, period)
         }
 
     def get_expenses_summary(self, period='month'):
+        """Получение сводки по расходам (из общего кэша)"""
+        return self.cached('expenses_summary', lambda: self.compute_expenses_summary(period), period)
+
+    def compute_expenses_summary(self, period='month'):
         """Получение сводки по расходам"""
-        df = self.load_data('expenses')
-        if df is None or df.empty:
+        monthly = self.load_rollup('expenses_by_month')
+        by_category = self.load_rollup('expenses_by_category')
+        if monthly is None or monthly.empty:
             return {
                 'total_expenses': 0,
                 'average_monthly': 0,
+                'average_per_period': 0,
                 'by_category': pd.Series(),
-                'monthly_history': pd.Series()
+                'monthly_history': pd.Series(),
+                'history': pd.Series()
             }
         
-        df['Month'] = df['Date'].dt.to_period('M')
-        monthly_expenses = df.groupby('Month')['Amount'].sum()
+        total_minor = monthly['Amount'].sum()
+        by_period = self.load_period_rollup('expenses', period)
         
         return {
-            'total_expenses': df['Amount'].sum(),
-            'average_monthly': monthly_expenses.mean(),
-            'by_category': df.groupby('Category')['Amount'].sum(),
-            'monthly_history': monthly_expenses
+            'total_expenses': from_minor_units(total_minor),
+            'average_monthly': from_minor_units(total_minor) / len(monthly),
+            'average_per_period': from_minor_units(total_minor) / len(by_period),
+            'by_category': from_minor_units(by_category.set_index('Category')['Amount']),
+            'monthly_history': self.monthly_series(monthly),
+            'history': self.period_series(by_period, period)
         }
 
+    def expense_matrix(self):
+        """Расходы в рублях: строки - месяцы, колонки - категории и общий итог"""
+        detail = self.load_rollup('expenses_by_month_category')
+        if detail is None:
+            return None
+        matrix = detail.pivot(index='Month', columns='Category', values='Amount').fillna(0)
+        matrix = from_minor_units(matrix)
+        matrix.index = pd.PeriodIndex(matrix.index.to_period('M'), name='Month')
+        matrix.columns = matrix.columns.astype(str)
+        matrix['Итого'] = matrix.sum(axis=1)
+        return matrix
+
+    def get_expense_trends(self):
+        """Скользящие статистики расходов по всем категориям и итогу (из общего кэша)"""
+        return self.cached('expense_trends', self.compute_expense_trends)
+
+    def compute_expense_trends(self):
+        """Скользящие статистики расходов за один проход по матрице месяц×категория"""
+        matrix = self.expense_matrix()
+        if matrix is None:
+            return None
+        engine = RollingStatistics(
+            TREND_CONFIG["WINDOW"],
+            span=TREND_CONFIG["EWMA_SPAN"],
+            quantiles=TREND_CONFIG["QUANTILES"]
+        )
+        engine.fit(matrix)
+        return engine
+
     def get_budget_vs_actual(self):
+        """Сравнение бюджета с фактическими расходами (из общего кэша)"""
+        return self.cached('budget_vs_actual', self.compute_budget_vs_actual)
+
+    def compute_budget_vs_actual(self):
         """Сравнение бюджета с фактическими расходами"""
         budget_df = self.load_data('budget')
-        expenses_df = self.load_data('expenses')
+        by_category = self.load_rollup('expenses_by_category')
         
-        if budget_df is None or expenses_df is None:
+        if budget_df is None or by_category is None:
             return None
         
-        # Расчет фактических расходов по категориям
-        actual = expenses_df.groupby('Category')['Amount'].sum()
-        
-        # Объединение с бюджетом
+        # Фактические расходы по категориям берутся из материализованного агрегата
+        return self.build_budget_comparison(budget_df, by_category.set_index('Category')['Amount'])
+
+    def build_budget_comparison(self, budget_df, actual):
+        """Объединение бюджета с фактическими расходами по категориям"""
+        budget = budget_df.set_index(budget_df['Category'].astype(object))['BudgetAmount']
         comparison = pd.DataFrame({
-            'Budget': budget_df.set_index('Category')['BudgetAmount'],
+            'Budget': budget,
             'Actual': actual
         }).fillna(0)
         
+        # Разница и процент считаются по целым копейкам, затем суммы переводятся в рубли
         comparison['Difference'] = comparison['Budget'] - comparison['Actual']
-        comparison['PercentUsed'] = (comparison['Actual'] / comparison['Budget'] * 100).round(2)
+        comparison['PercentUsed'] = (comparison['Actual'] / comparison['Budget'] * 100).astype('float64').round(2)
         
+        money = ['Budget', 'Actual', 'Difference']
+        comparison[money] = from_minor_units(comparison[money])
         return comparison
 
+    def get_dashboard_bundle(self):
+        """Все данные главной страницы за одно обращение (из общего кэша)"""
+        return self.cached('dashboard_bundle', self.compute_dashboard_bundle)
+
+    def compute_dashboard_bundle(self):
+        """Данные главной страницы: каждый лист и агрегат читается один раз"""
+        net_worth = self.get_net_worth_summary()
+        income = self.get_income_summary()
+        expenses = self.get_expenses_summary()
+        
+        # Итоги по категориям общие для сводки расходов и сравнения с бюджетом
+        budget_df = self.load_data('budget')
+        by_category = self.load_rollup('expenses_by_category')
+        budget = None
+        if budget_df is not None and by_category is not None:
+            budget = self.build_budget_comparison(budget_df, by_category.set_index('Category')['Amount'])
+        
+        return {
+            'net_worth': net_worth,
+            'income': income,
+            'expenses': expenses,
+            'budget': budget
+        }
+
 # Создание глобального экземпляра для использования в приложении
 data_loader = DataLoader()
 
-def process_uploaded_file(uploaded_file):
+def process_uploaded_file(uploaded_file, streaming=None):
     """Обработка загруженного файла для использования в приложении"""
     try:
-        success = data_loader.process_uploaded_file(uploaded_file)
+        success = data_loader.process_uploaded_file(uploaded_file, streaming)
         return success
     except Exception as e:
-        log_error(f"Ошибка при обработке файла: {str(e)}")
+        log_error("Ошибка при обработке файла: {}", e)
+        raise
+
+def parse_sheet(content, sheet_key):
+    """Точка входа рабочего процесса: разбор и валидация одного листа"""
+    return data_loader.parse_sheet(content, sheet_key)
+
+def start_upload(uploaded_file, mode='replace'):
+    """Запуск фоновой загрузки файла для использования в приложении"""
+    try:
+        return data_loader.start_upload(uploaded_file, mode)
+    except Exception as e:
+        log_error("Ошибка при запуске загрузки файла: {}", e)
+        raise
+
+def append_uploaded_file(uploaded_file):
+    """Добавление новых операций из загруженного файла"""
+    try:
+        return data_loader.append_uploaded_file(uploaded_file)
+    except Exception as e:
+        log_error("Ошибка при добавлении данных: {}", e)
         raise 
\ No newline at end of file
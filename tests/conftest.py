@@ -0,0 +1,67 @@
+import io
+import sys
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pytest
+
+# Тесты запускаются из корня репозитория: модули приложения импортируются напрямую
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from data_loader import DataLoader
+from utils.storage import ParquetStore, SQLiteStore
+
+@pytest.fixture
+def sheets():
+    """Небольшой набор листов с операциями за два года"""
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2022-01-01', '2023-12-31')
+    return {
+        'Net Worth': pd.DataFrame({
+            'Date': pd.date_range('2022-01-01', periods=200, freq='3D'),
+            'Assets': rng.uniform(1e5, 2e5, 200).round(2),
+            'Liabilities': rng.uniform(1e4, 5e4, 200).round(2)
+        }),
+        'Income': pd.DataFrame({
+            'IncomeID': range(1, 61),
+            'Date': rng.choice(dates, 60),
+            'Source': rng.choice(['Зарплата', 'Фриланс', 'Дивиденды'], 60),
+            'Amount': rng.uniform(1000, 90000, 60).round(2)
+        }),
+        'Expenses': pd.DataFrame({
+            'ExpenseID': range(1, 401),
+            'Date': rng.choice(dates, 400),
+            'Category': rng.choice(['Еда', 'Транспорт', 'Жилье', 'Развлечения'], 400),
+            'Description': rng.choice(['Магазин', 'Такси', 'Аренда'], 400),
+            'Amount': rng.uniform(10, 5000, 400).round(2)
+        }),
+        'Budget': pd.DataFrame({
+            'Category': ['Еда', 'Транспорт', 'Жилье', 'Развлечения'],
+            'BudgetAmount': [30000.0, 10000.0, 50000.0, 5000.0]
+        })
+    }
+
+@pytest.fixture
+def make_workbook():
+    """Построение файла Excel в памяти, как его передает st.file_uploader"""
+    def make(sheets):
+        buffer = io.BytesIO()
+        with pd.ExcelWriter(buffer) as writer:
+            for name, df in sheets.items():
+                df.to_excel(writer, sheet_name=name, index=False)
+        buffer.seek(0)
+        return buffer
+    return make
+
+@pytest.fixture(params=['parquet', 'sqlite'])
+def loader(request, tmp_path):
+    """Загрузчик данных с хранилищем во временном каталоге, для обоих бэкендов"""
+    loader = DataLoader()
+    loader.data_file = tmp_path / "financial_data.xlsx"
+    if request.param == 'sqlite':
+        loader.store = SQLiteStore(tmp_path / "finance.db")
+    else:
+        loader.store = ParquetStore(tmp_path / "store")
+    # Фоновый расчет сводок не нужен: тесты читают данные напрямую
+    loader.start_precompute = lambda version: None
+    return loader
@@ -0,0 +1,74 @@
+import threading
+import pytest
+import yaml
+from utils.credentials import CredentialsStore
+
+def user(email):
+    return {"email": email, "name": email.split("@")[0], "password": "hash"}
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / "credentials.yaml"
+    path.write_text(yaml.dump({"usernames": {"admin": user("Admin@Example.com")}}))
+    return path
+
+def test_default_file_created_when_missing(tmp_path):
+    store = CredentialsStore(tmp_path / "credentials.yaml", default_factory=lambda: {"usernames": {"admin": user("a@b.c")}})
+    assert store.get_user("admin")["email"] == "a@b.c"
+    assert (tmp_path / "credentials.yaml").exists()
+
+def test_missing_file_without_default(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        CredentialsStore(tmp_path / "credentials.yaml").load()
+
+def test_add_user_rejects_taken_name(path):
+    store = CredentialsStore(path)
+    assert store.add_user("bob", user("bob@example.com"))
+    assert not store.add_user("bob", user("other@example.com"))
+    assert store.get_user("bob")["email"] == "bob@example.com"
+
+def test_set_password_unknown_user(path):
+    store = CredentialsStore(path)
+    assert not store.set_password("nobody", "hash")
+    assert store.set_password("admin", "new")
+    assert CredentialsStore(path).get_user("admin")["password"] == "new"
+
+def test_email_index_ignores_case_and_follows_file(path):
+    store, other = CredentialsStore(path), CredentialsStore(path)
+    assert store.usernames_for_email("admin@example.COM") == {"admin"}
+    # Изменение другим экземпляром (другим процессом) видно после смены mtime файла
+    other.add_user("admin2", user("admin@example.com"))
+    assert store.usernames_for_email("ADMIN@example.com") == {"admin", "admin2"}
+    assert store.usernames_for_email(None) == set()
+
+def test_load_returns_independent_usernames(path):
+    store = CredentialsStore(path)
+    credentials = store.load()
+    credentials["usernames"]["intruder"] = user("x@y.z")
+    assert store.get_user("intruder") is None
+
+def test_concurrent_registrations_are_not_lost(path):
+    # Каждый поток использует свой экземпляр, как отдельные процессы приложения
+    def register(index):
+        CredentialsStore(path).add_user(f"user{index}", user(f"user{index}@example.com"))
+
+    threads = [threading.Thread(target=register, args=(index,)) for index in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    usernames = CredentialsStore(path).load()["usernames"]
+    assert set(usernames) == {"admin"} | {f"user{index}" for index in range(20)}
+
+def test_failed_write_keeps_previous_file(path, monkeypatch):
+    store = CredentialsStore(path)
+    original = path.read_text()
+
+    def broken_dump(*args, **kwargs):
+        raise OSError("диск заполнен")
+
+    monkeypatch.setattr(yaml, "dump", broken_dump)
+    with pytest.raises(OSError):
+        store.add_user("bob", user("bob@example.com"))
+    assert path.read_text() == original
+    assert [file.name for file in path.parent.iterdir() if file.suffix == ".tmp"] == []
@@ -0,0 +1,97 @@
+import pandas as pd
+import pytest
+from utils.data_processor import to_minor_units
+
+def expected_sheet(df):
+    """Лист в виде, в котором его возвращает load_data: по дате, суммы в копейках"""
+    df = df.sort_values('Date', kind='stable', ignore_index=True)
+    return df.assign(Amount=to_minor_units(df['Amount']))
+
+def reference_rollup(df, by):
+    """Агрегат pandas по исходным строкам: суммы в копейках по ключам by"""
+    df = df.assign(
+        Month=df['Date'].dt.to_period('M').dt.start_time,
+        Amount=to_minor_units(df['Amount'])
+    )
+    return df.groupby(by)['Amount'].sum().astype('int64').sort_index()
+
+def loaded_rollup(rollup, by):
+    """Материализованный или вычисленный хранилищем агрегат в том же виде"""
+    rollup = rollup.assign(**{key: rollup[key].astype(object) for key in by if key != 'Month'})
+    return rollup.set_index(by)['Amount'].astype('int64').sort_index()
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_ingest_matches_source(loader, sheets, make_workbook, streaming):
+    assert loader.process_uploaded_file(make_workbook(sheets), streaming=streaming)
+
+    expenses = loader.load_data('expenses')
+    expected = expected_sheet(sheets['Expenses'])
+    assert expenses['Date'].is_monotonic_increasing
+    assert expenses['ExpenseID'].astype('int64').tolist() == expected['ExpenseID'].tolist()
+    assert expenses['Category'].astype(object).tolist() == expected['Category'].tolist()
+    assert expenses['Amount'].tolist() == expected['Amount'].tolist()
+
+    net_worth = loader.load_data('net_worth')
+    assert net_worth['Assets'].tolist() == to_minor_units(sheets['Net Worth']['Assets']).tolist()
+
+@pytest.mark.parametrize('name, sheet, by', [
+    ('expenses_by_month', 'Expenses', ['Month']),
+    ('expenses_by_category', 'Expenses', ['Category']),
+    ('expenses_by_month_category', 'Expenses', ['Month', 'Category']),
+    ('income_by_month', 'Income', ['Month']),
+    ('income_by_source', 'Income', ['Source'])
+])
+def test_rollups_match_pandas(loader, sheets, make_workbook, name, sheet, by):
+    loader.process_uploaded_file(make_workbook(sheets))
+
+    expected = reference_rollup(sheets[sheet], by)
+    pd.testing.assert_series_equal(loaded_rollup(loader.load_rollup(name), by), expected, check_names=False)
+
+def test_period_rollup_matches_pandas(loader, sheets, make_workbook):
+    loader.process_uploaded_file(make_workbook(sheets))
+
+    expenses = sheets['Expenses']
+    expected = to_minor_units(expenses['Amount']).groupby(expenses['Date'].dt.to_period('Q').dt.start_time).sum()
+    quarters = loader.load_period_rollup('expenses', 'quarter').set_index('Period')['Amount']
+    assert quarters.astype('int64').tolist() == expected.tolist()
+    assert list(quarters.index) == list(expected.index)
+
+def test_query_returns_rubles(loader, sheets, make_workbook):
+    loader.process_uploaded_file(make_workbook(sheets))
+
+    expenses = sheets['Expenses'].sort_values('Date', kind='stable')
+    expected = expenses[expenses['Date'].between('2023-03-01', '2023-05-31') & (expenses['Category'] == 'Еда')]
+    result = loader.query('expenses').between('2023-03-01', '2023-05-31').where(category='Еда').execute()
+    assert result['ExpenseID'].astype('int64').tolist() == expected['ExpenseID'].tolist()
+    assert result['Amount'].tolist() == pytest.approx(expected['Amount'].tolist())
+
+@pytest.mark.parametrize('warm', [False, True])
+def test_append_skips_known_ids(loader, sheets, make_workbook, warm):
+    loader.process_uploaded_file(make_workbook(sheets))
+    if warm:
+        # Лист в кэше переносится в новую версию без повторного чтения
+        loader.load_data('expenses')
+
+    known = sheets['Expenses'].head(10)
+    new = pd.DataFrame({
+        'ExpenseID': range(401, 411),
+        # Часть новых операций датирована раньше уже загруженных
+        'Date': pd.to_datetime(['2021-12-15'] * 5 + ['2024-01-10'] * 5),
+        'Category': 'Еда',
+        'Description': 'Магазин',
+        'Amount': [100.5] * 10
+    })
+    delta = pd.concat([known, new, new.head(2)], ignore_index=True)
+    assert loader.append_uploaded_file(make_workbook({'Expenses': delta})) == {'expenses': 10}
+
+    combined = pd.concat([sheets['Expenses'], new], ignore_index=True)
+    expenses = loader.load_data('expenses')
+    assert expenses['Date'].is_monotonic_increasing
+    assert sorted(expenses['ExpenseID'].astype('int64')) == sorted(combined['ExpenseID'])
+    for name, by in (('expenses_by_month', ['Month']), ('expenses_by_category', ['Category'])):
+        expected = reference_rollup(combined, by)
+        pd.testing.assert_series_equal(loaded_rollup(loader.load_rollup(name), by), expected, check_names=False)
+
+def test_append_requires_loaded_data(loader, sheets, make_workbook):
+    with pytest.raises(ValueError):
+        loader.append_uploaded_file(make_workbook({'Expenses': sheets['Expenses']}))
@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+import pytest
+from utils.data_processor import to_minor_units, from_minor_units, format_currency, lttb_indices, downsample_frame, RollingStatistics
+
+def test_minor_units_round_trip():
+    amounts = pd.Series([0.1, 0.2, 19.99, 1234567.89, -10.5, np.nan])
+    minor = to_minor_units(amounts)
+    assert minor.dtype == 'Int64'
+    assert minor.tolist()[:5] == [10, 20, 1999, 123456789, -1050]
+    assert minor.isna().tolist()[-1]
+    assert from_minor_units(minor).tolist()[:5] == pytest.approx([0.1, 0.2, 19.99, 1234567.89, -10.5])
+
+def test_minor_units_sum_exactly():
+    # Сумма в копейках не накапливает ошибку представления float
+    minor = to_minor_units(pd.Series([0.1] * 10))
+    assert minor.sum() == 100
+    assert from_minor_units(minor.sum()) == 1.0
+
+@pytest.mark.parametrize('amount, text', [
+    (2.675, '2.68 ₽'),
+    (1234567.005, '1,234,567.01 ₽'),
+    (np.int64(3), '3.00 ₽'),
+    (float('nan'), '—'),
+    (float('inf'), '—'),
+    (-np.inf, '—')
+])
+def test_format_currency(amount, text):
+    assert format_currency(amount) == text
+
+def test_lttb_keeps_endpoints_and_peaks():
+    y = np.sin(np.linspace(0, 20, 5000))
+    y[1234] = 50.0
+    indices = lttb_indices(np.arange(5000), y, 200)
+    assert len(indices) == 200
+    assert indices[0] == 0 and indices[-1] == 4999
+    assert (np.diff(indices) > 0).all()
+    assert 1234 in indices
+
+def test_lttb_returns_short_series_unchanged():
+    assert lttb_indices(np.arange(50), np.ones(50), 100).tolist() == list(range(50))
+
+def test_downsample_frame_shares_rows_between_series():
+    rng = np.random.default_rng(1)
+    df = pd.DataFrame({
+        'Date': pd.date_range('2020-01-01', periods=3000, freq='h'),
+        'Assets': rng.normal(size=3000).cumsum(),
+        'Liabilities': rng.normal(size=3000).cumsum()
+    })
+    points = downsample_frame(df, 'Date', ['Assets', 'Liabilities'], 300)
+    assert len(points) <= 300
+    assert points.index.is_monotonic_increasing
+    assert points.index[0] == 0 and points.index[-1] == 2999
+    # Точки каждого ряда входят в общий набор строк
+    for column in ('Assets', 'Liabilities'):
+        own = lttb_indices(df['Date'].astype('int64'), df[column], 150)
+        assert set(own) <= set(points.index)
+
+@pytest.fixture
+def matrix():
+    """Расходы по категориям за месяцы с пропусками"""
+    rng = np.random.default_rng(2)
+    values = rng.uniform(100, 1000, (36, 4))
+    values[rng.random((36, 4)) < 0.15] = np.nan
+    return pd.DataFrame(
+        values,
+        index=pd.period_range('2021-01', periods=36, freq='M'),
+        columns=['Еда', 'Транспорт', 'Жилье', 'Итого']
+    )
+
+def test_rolling_statistics_match_pandas(matrix):
+    result = RollingStatistics(window=3, span=6, quantiles=(0.5,)).fit(matrix)
+    rolling = matrix.rolling(window=3, min_periods=1)
+    pd.testing.assert_frame_equal(result['sma'], rolling.mean())
+    pd.testing.assert_frame_equal(result['min'], rolling.min())
+    pd.testing.assert_frame_equal(result['max'], rolling.max())
+    pd.testing.assert_frame_equal(result['std'], rolling.std())
+    pd.testing.assert_frame_equal(result['p50'], rolling.quantile(0.5))
+    pd.testing.assert_frame_equal(result['ewma'], matrix.ewm(span=6, adjust=False, ignore_na=True).mean())
+
+def test_rolling_statistics_update_matches_fit(matrix):
+    engine = RollingStatistics(window=3, span=6)
+    engine.fit(matrix.iloc[:30])
+    # Новые месяцы и исправленная сумма в последнем известном месяце
+    changed = matrix.copy()
+    changed.iloc[29, 0] = 5000.0
+    updated = engine.update(changed)
+    expected = RollingStatistics(window=3, span=6).fit(changed)
+    for name, values in expected.items():
+        pd.testing.assert_frame_equal(updated[name], values)
+
+def test_rolling_statistics_keep_series_shape(matrix):
+    result = RollingStatistics(window=3).fit(matrix['Итого'])
+    assert isinstance(result['sma'], pd.Series)
+    pd.testing.assert_series_equal(result['sma'], matrix['Итого'].rolling(3, min_periods=1).mean())
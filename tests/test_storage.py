@@ -0,0 +1,69 @@
+import pandas as pd
+import pytest
+from utils.storage import ParquetStore, SQLiteStore
+
+@pytest.fixture(params=['parquet', 'sqlite'])
+def open_store(request, tmp_path):
+    """Открытие хранилища во временном каталоге; повторный вызов - второй экземпляр"""
+    if request.param == 'sqlite':
+        return lambda: SQLiteStore(tmp_path / "finance.db")
+    return lambda: ParquetStore(tmp_path / "store")
+
+def frame(*amounts):
+    return pd.DataFrame({
+        'Date': pd.date_range('2023-01-01', periods=len(amounts)),
+        'Amount': pd.array(amounts, dtype='Int64')
+    })
+
+def test_snapshot_visible_only_after_commit(open_store):
+    store = open_store()
+    store.begin_snapshot('v1')
+    store.write('expenses', frame(1, 2), 'v1')
+    assert store.current_version() is None
+
+    store.commit_snapshot('v1')
+    assert store.current_version() == 'v1'
+    assert store.read('expenses')['Amount'].tolist() == [1, 2]
+
+def test_discard_keeps_current_snapshot(open_store):
+    store = open_store()
+    store.begin_snapshot('v1')
+    store.write('expenses', frame(1), 'v1')
+    store.commit_snapshot('v1')
+
+    store.begin_snapshot('v2')
+    store.write('expenses', frame(5, 6), 'v2')
+    store.discard_snapshot('v2')
+    assert store.current_version() == 'v1'
+    assert store.read('expenses')['Amount'].tolist() == [1]
+    assert not store.exists('expenses', 'v2')
+
+def test_commit_keeps_pending_snapshots(open_store):
+    store = open_store()
+    store.begin_snapshot('v1')
+    store.write('expenses', frame(1), 'v1')
+    store.commit_snapshot('v1')
+
+    # v2 еще записывается, когда фиксируются более новые снимки
+    store.begin_snapshot('v2')
+    store.write('expenses', frame(2), 'v2')
+    for version in ('v3', 'v4'):
+        store.begin_snapshot(version)
+        store.write('expenses', frame(3), version)
+        store.commit_snapshot(version)
+
+    store.commit_snapshot('v2')
+    assert store.read('expenses')['Amount'].tolist() == [2]
+
+def test_version_follows_other_instance(open_store):
+    reader, writer = open_store(), open_store()
+    writer.begin_snapshot('v1')
+    writer.write('expenses', frame(1), 'v1')
+    writer.commit_snapshot('v1')
+    assert reader.current_version() == 'v1'
+
+    writer.begin_snapshot('v2', 'v1', ['expenses'])
+    writer.append('expenses', frame(7), 'v2')
+    writer.commit_snapshot('v2')
+    assert reader.current_version() == 'v2'
+    assert reader.read('expenses')['Amount'].tolist() == [1, 7]
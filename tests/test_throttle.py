@@ -0,0 +1,88 @@
+import types
+import pytest
+import utils.throttle
+from utils.throttle import LoginThrottle
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Управляемое время модуля ограничения попыток"""
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(utils.throttle, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+def make_throttle(**overrides):
+    settings = dict(
+        capacity=2, refill_seconds=10.0, free_failures=2, backoff_base=2.0,
+        backoff_max=30.0, idle_ttl=100.0, max_entries=100
+    )
+    settings.update(overrides)
+    return LoginThrottle(**settings)
+
+def test_tokens_refill_over_time(clock):
+    throttle = make_throttle()
+    assert throttle.acquire("alice") == 0
+    assert throttle.acquire("alice") == 0
+    assert throttle.acquire("alice") == pytest.approx(10.0)
+    clock.now += 10.0
+    assert throttle.acquire("alice") == 0
+
+def test_denied_attempt_spends_no_tokens(clock):
+    throttle = make_throttle()
+    throttle.acquire("client")
+    throttle.acquire("client")
+    assert throttle.acquire("alice", "client") > 0
+    # Токены alice не израсходованы отклоненной попыткой
+    assert throttle.acquire("alice") == 0
+    assert throttle.acquire("alice") == 0
+
+def test_backoff_doubles_up_to_limit(clock):
+    throttle = make_throttle(capacity=100)
+    throttle.failure("alice")
+    throttle.failure("alice")
+    assert throttle.acquire("alice") == 0
+    waits = []
+    for _ in range(6):
+        throttle.failure("alice")
+        waits.append(throttle.acquire("alice"))
+    assert waits == pytest.approx([2.0, 4.0, 8.0, 16.0, 30.0, 30.0])
+
+def test_success_resets_failures(clock):
+    throttle = make_throttle()
+    for _ in range(3):
+        throttle.failure("alice")
+    assert throttle.acquire("alice") > 0
+    throttle.success("alice")
+    assert throttle.acquire("alice") == 0
+
+def test_empty_keys_are_ignored(clock):
+    throttle = make_throttle()
+    throttle.failure(None, "")
+    assert throttle.acquire(None) == 0
+    assert len(throttle._buckets) == 0
+
+def test_idle_buckets_expire_but_blocked_ones_stay(clock):
+    throttle = make_throttle(backoff_max=1000.0)
+    throttle.acquire("idle")
+    for _ in range(10):
+        throttle.failure("blocked")
+    clock.now += 150.0
+    throttle.acquire("fresh")
+    assert "idle" not in throttle._buckets
+    assert "blocked" in throttle._buckets
+    assert throttle.acquire("blocked") > 0
+
+def test_unblocked_buckets_evicted_before_blocked(clock):
+    throttle = make_throttle(max_entries=3)
+    for _ in range(3):
+        throttle.failure("attacker")
+    for key in ("a", "b", "c", "d"):
+        throttle.acquire(key)
+    assert list(throttle._buckets) == ["attacker", "c", "d"]
+
+def test_cap_holds_when_every_bucket_is_blocked(clock):
+    throttle = make_throttle(max_entries=3, free_failures=0)
+    for index in range(10):
+        throttle.failure(f"key{index}")
+        assert len(throttle._buckets) <= 3
+    # Вытесняются самые давние заблокированные корзины
+    assert list(throttle._buckets) == ["key7", "key8", "key9"]
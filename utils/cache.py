@@ -0,0 +1,145 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from utils.logger import log_debug
+
+def estimate_size(value):
+    """Оценка объема памяти, занимаемого значением, в байтах"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(estimate_size(v) for v in value)
+    if hasattr(value, '__dict__'):
+        # Объекты с состоянием (например, движок скользящих статистик) оцениваются по атрибутам
+        return sys.getsizeof(value) + estimate_size(vars(value))
+    return sys.getsizeof(value)
+
+class SnapshotCache:
+    """Потокобезопасный LRU-кэш с ограничением по объему памяти
+
+    Ключи кэша включают версию данных, поэтому после загрузки нового файла
+    старые записи становятся недостижимыми и вытесняются.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self._key_locks = {}
+
+    def get(self, key, default=None):
+        """Получение значения с обновлением порядка использования"""
+        with self._lock:
+            if key not in self._entries:
+                return default
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def put(self, key, value, size=None):
+        """Сохранение значения с вытеснением давно не использованных записей"""
+        if size is None:
+            size = estimate_size(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if size > self.max_bytes:
+                log_debug("Значение {} ({} байт) превышает лимит кэша и не сохранено", key, size)
+                return value
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                log_debug("Из кэша вытеснена запись {}", evicted_key)
+        return value
+
+    def put_many(self, items):
+        """Одновременная публикация нескольких значений: читатели видят все или ни одного"""
+        sized = [(key, value, estimate_size(value)) for key, value in items.items()]
+        with self._lock:
+            for key, value, size in sized:
+                self.put(key, value, size)
+
+    def get_or_compute(self, key, compute):
+        """Получение значения из кэша или однократное вычисление для всех сессий"""
+        missing = object()
+        value = self.get(key, missing)
+        if value is not missing:
+            return value
+
+        # Параллельные сессии ждут одно вычисление вместо повторного разбора данных
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        try:
+            with key_lock:
+                value = self.get(key, missing)
+                if value is not missing:
+                    return value
+                value = compute()
+                if value is not None:
+                    self.put(key, value)
+                return value
+        finally:
+            with self._lock:
+                self._key_locks.pop(key, None)
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+class SessionCache:
+    """Потокобезопасный кэш проверенных сессий с временем жизни и ограничением числа записей
+
+    Записи живут не дольше ttl секунд (или меньше, если указан собственный срок),
+    а при превышении max_entries вытесняются давно не использованные.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Значение по ключу, если запись есть и не истекла"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, expires_at=None):
+        """Сохранение значения до истечения ttl или срока expires_at, если он раньше"""
+        now = time.time()
+        deadline = now + self.ttl if expires_at is None else min(now + self.ttl, expires_at)
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, deadline)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def pop(self, key):
+        """Удаление записи; возвращает значение или None"""
+        with self._lock:
+            entry = self._entries.pop(key, None)
+        return None if entry is None else entry[0]
+
+    def clear(self):
+        """Полная очистка кэша"""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,129 @@
+import copy
+import fcntl
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+import yaml
+from yaml.loader import SafeLoader
+from utils.logger import log_debug, log_info
+
+class CredentialsStore:
+    """Учетные данные пользователей с кэшированием разобранного файла в памяти
+
+    Файл перечитывается только при изменении его mtime, поэтому перезапуски
+    скрипта Streamlit не разбирают YAML заново. Изменения выполняются под
+    межпроцессной блокировкой файла и записываются атомарно (временный файл +
+    переименование), так что параллельные регистрации не теряют друг друга.
+    """
+
+    def __init__(self, path, default_factory=None):
+        self.path = Path(path)
+        self.lock_path = self.path.with_name(self.path.name + ".lock")
+        self.default_factory = default_factory
+        self.credentials = None
+        self.mtime = None
+        self.email_index = {}
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def file_lock(self):
+        """Исключительная блокировка файла учетных данных для потоков и процессов"""
+        with self._lock:
+            with open(self.lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def refresh(self):
+        """Повторный разбор файла, если он изменился с момента последнего чтения"""
+        with self._lock:
+            if not self.path.exists():
+                if self.default_factory is None:
+                    raise FileNotFoundError(f"Файл учетных данных не найден: {self.path}")
+                with self.file_lock():
+                    if not self.path.exists():
+                        self.write(self.default_factory())
+                        log_info("Создан файл {} с учетными данными по умолчанию", self.path.name)
+
+            stat = os.stat(self.path)
+            mtime = (stat.st_mtime_ns, stat.st_size)
+            if mtime != self.mtime:
+                with open(self.path) as file:
+                    credentials = yaml.load(file, Loader=SafeLoader) or {}
+                credentials.setdefault("usernames", {})
+                self.credentials = credentials
+                self.mtime = mtime
+                email_index = {}
+                for username, user in credentials["usernames"].items():
+                    if user.get("email"):
+                        email_index.setdefault(user["email"].lower(), set()).add(username)
+                self.email_index = email_index
+                log_debug("Учетные данные перечитаны из {}", self.path.name)
+            return self.credentials
+
+    def load(self):
+        """Копия учетных данных для передачи в stauth.Authenticate"""
+        credentials = self.refresh()
+        # Authenticate заменяет словарь usernames, поэтому передаем копию верхнего уровня
+        return {**credentials, "usernames": dict(credentials["usernames"])}
+
+    def get_user(self, username):
+        """Учетная запись по имени пользователя или None"""
+        return self.refresh()["usernames"].get(username)
+
+    def usernames_for_email(self, email):
+        """Имена пользователей с указанным email (без учета регистра)"""
+        self.refresh()
+        return self.email_index.get((email or "").lower(), set())
+
+    def write(self, credentials):
+        """Атомарная запись файла: временный файл в том же каталоге и переименование"""
+        fd, temp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as file:
+                yaml.dump(credentials, file, allow_unicode=True)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def update(self, change):
+        """Изменение учетных данных под блокировкой: чтение, change(credentials), запись
+
+        change получает свежую копию данных и может вернуть False, чтобы отменить запись.
+        """
+        # Файл по умолчанию создается до захвата блокировки: flock не реентерабелен
+        self.refresh()
+        with self.file_lock():
+            credentials = copy.deepcopy(self.refresh())
+            if change(credentials) is False:
+                return False
+            self.write(credentials)
+            # Следующее обращение перечитает записанный файл и перестроит индекс
+            self.mtime = None
+            self.refresh()
+            log_info("Учетные данные успешно сохранены")
+            return True
+
+    def add_user(self, username, user):
+        """Добавление пользователя; False, если имя уже занято"""
+        def change(credentials):
+            if username in credentials["usernames"]:
+                return False
+            credentials["usernames"][username] = user
+        return self.update(change)
+
+    def set_password(self, username, hashed_password):
+        """Замена хэша пароля пользователя; False, если пользователь не найден"""
+        def change(credentials):
+            if username not in credentials["usernames"]:
+                return False
+            credentials["usernames"][username]["password"] = hashed_password
+        return self.update(change)
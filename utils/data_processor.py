@@ -1,6 +1,24 @@
+import warnings
+import numpy as np
 import pandas as pd
+from decimal import Decimal, ROUND_HALF_UP
+from numpy.lib.stride_tricks import sliding_window_view
+from config import CURRENCY_MINOR_UNITS
 from utils.logger import log_debug, log_error
 
+def to_minor_units(values):
+    """Перевод денежных сумм в целые минимальные единицы (копейки)"""
+    amounts = pd.to_numeric(values)
+    return (amounts * CURRENCY_MINOR_UNITS).round().astype('Int64')
+
+def from_minor_units(values):
+    """Перевод сумм из копеек в основные единицы для отображения"""
+    if isinstance(values, (pd.Series, pd.DataFrame)):
+        return values.astype('float64') / CURRENCY_MINOR_UNITS
+    if pd.isna(values):
+        return float('nan')
+    return int(values) / CURRENCY_MINOR_UNITS
+
 def calculate_growth_rate(current, previous):
     """Расчет темпа роста"""
     try:
@@ -8,15 +26,21 @@ def calculate_growth_rate(current, previous):
             return float('inf') if current > 0 else float('-inf') if current < 0 else 0
         return ((current - previous) / abs(previous)) * 100
     except Exception as e:
-        log_error(f"Ошибка при расчете темпа роста: {str(e)}")
+        log_error("Ошибка при расчете темпа роста: {}", e)
         return 0
 
 def format_currency(amount, currency="₽"):
     """Форматирование денежных значений"""
     try:
-        return f"{amount:,.2f} {currency}"
+        value = Decimal(str(amount))
+        # Пропуски и бесконечности не являются суммой, отображаем прочерк
+        if not value.is_finite():
+            return "—"
+        # Округление выполняется в Decimal, чтобы 2.675 отображалось как 2.68
+        value = value.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        return f"{value:,.2f} {currency}"
     except Exception as e:
-        log_error(f"Ошибка при форматировании валюты: {str(e)}")
+        log_error("Ошибка при форматировании валюты: {}", e)
         return f"0.00 {currency}"
 
 def calculate_moving_average(data, window=3):
@@ -24,7 +48,7 @@ def calculate_moving_average(data, window=3):
     try:
         return data.rolling(window=window).mean()
     except Exception as e:
-        log_error(f"Ошибка при расчете скользящей средней: {str(e)}")
+        log_error("Ошибка при расчете скользящей средней: {}", e)
         return data
 
 def get_trend_analysis(data):
@@ -42,7 +66,7 @@ def get_trend_analysis(data):
             'previous': previous
         }
     except Exception as e:
-        log_error(f"Ошибка при анализе тренда: {str(e)}")
+        log_error("Ошибка при анализе тренда: {}", e)
         return None
 
 def categorize_expenses(expenses_df, threshold=0.05):
@@ -54,19 +78,262 @@ def categorize_expenses(expenses_df, threshold=0.05):
         total_expenses = expenses_df.sum()
         if total_expenses == 0:
             return pd.Series()
-            
-        # Определение основных и мелких категорий
-        main_categories = expenses_df[expenses_df/total_expenses >= threshold]
-        small_categories = expenses_df[expenses_df/total_expenses < threshold]
         
-        # Объединение мелких категорий
-        if not small_categories.empty:
-            result = main_categories.copy()
-            result['Другое'] = small_categories.sum()
-            return result
+        # Итоги по категориям - матрица из одного периода
+        return categorize_expenses_matrix(expenses_df.to_frame().T, threshold).iloc[0]
         
-        return main_categories
+    except Exception as e:
+        log_error("Ошибка при категоризации расходов: {}", e)
+        return pd.Series()
+
+def categorize_expenses_matrix(matrix, threshold=0.05, top_n=None):
+    """Группировка мелких категорий в «Другое» отдельно для каждого периода
+    
+    Строки matrix - периоды, колонки - категории. В каждой строке остаются категории
+    с долей не меньше threshold (или top_n крупнейших, если top_n задан), остальные
+    суммируются в колонку «Другое». Все строки обрабатываются одной операцией numpy.
+    """
+    values = matrix.to_numpy(dtype='float64', na_value=0)
+    if top_n is not None:
+        # Ранг категории внутри строки: 0 - самая крупная
+        ranks = np.argsort(np.argsort(-values, axis=1, kind='stable'), axis=1, kind='stable')
+        keep = ranks < top_n
+    else:
+        totals = values.sum(axis=1, keepdims=True)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            keep = values / totals >= threshold
+    
+    # Колонки, не прошедшие отбор ни в одном периоде, в результат не попадают
+    columns = keep.any(axis=0)
+    result = pd.DataFrame(
+        np.where(keep, values, 0)[:, columns],
+        index=matrix.index,
+        columns=matrix.columns[columns]
+    )
+    if not keep.all():
+        result['Другое'] = np.where(keep, 0, values).sum(axis=1)
+    return result
+
+# Частоты pandas для поддерживаемых периодов агрегации
+PERIOD_FREQUENCIES = {
+    'day': 'D',
+    'week': 'W',
+    'month': 'M',
+    'quarter': 'Q',
+    'year': 'Y'
+}
+
+def period_start(dates, period):
+    """Начало периода (дня, недели, месяца, квартала, года) для каждой даты"""
+    return dates.dt.to_period(PERIOD_FREQUENCIES[period]).dt.start_time
+
+def resample_rollup(rollup, period, keys=(), source='Day', target='Period', value='Amount'):
+    """Агрегат по более крупным периодам, полученный из агрегата по более мелким"""
+    start = period_start(rollup[source], period).rename(target)
+    grouped = rollup.groupby([start] + [rollup[key] for key in keys], observed=True)[value].sum()
+    return grouped.reset_index()
+
+def grouped_sum(df, by, value='Amount'):
+    """Сумма value по колонкам by; 'Day' и 'Month' - начало дня и месяца колонки Date"""
+    keys = [
+        period_start(df['Date'], column.lower()).rename(column) if column in ('Day', 'Month') else df[column]
+        for column in by
+    ]
+    rollup = df.groupby(keys, observed=True)[value].sum().reset_index()
+    for column in by:
+        if isinstance(rollup[column].dtype, pd.CategoricalDtype):
+            # Агрегаты малы, обычные строки упрощают их объединение между пакетами
+            rollup[column] = rollup[column].astype(object)
+    return rollup
+
+def slice_by_date(df, start=None, end=None, column='Date'):
+    """Строки за период [start, end] по отсортированной колонке дат (бинарный поиск)"""
+    dates = df[column].values
+    left = 0 if start is None else dates.searchsorted(pd.Timestamp(start).to_datetime64(), side='left')
+    right = len(df) if end is None else dates.searchsorted(pd.Timestamp(end).to_datetime64(), side='right')
+    return df.iloc[left:right]
+
+def combine_rollups(parts, keys, value='Amount'):
+    """Объединение частичных агрегатов (например, по пакетам строк) в один"""
+    parts = [part for part in parts if part is not None]
+    if not parts:
+        columns = {
+            key: pd.Series(dtype='datetime64[ns]' if key in ('Day', 'Month') else 'object')
+            for key in keys
+        }
+        return pd.DataFrame({**columns, value: pd.Series(dtype='Int64')})
+    combined = pd.concat(parts, ignore_index=True)
+    return combined.groupby(keys, observed=True)[value].sum().reset_index()
+
+def lttb_indices(x, y, threshold):
+    """Индексы точек, отобранных алгоритмом Largest-Triangle-Three-Buckets"""
+    n = len(y)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    
+    # Первая и последняя точки сохраняются, остальные делятся на threshold-2 корзины
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0] = 0
+    indices[-1] = n - 1
+    
+    selected = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = np.nanmean(x[end:next_end])
+        avg_y = np.nanmean(y[end:next_end])
         
+        # Выбирается точка, образующая наибольший треугольник с предыдущей
+        # выбранной точкой и средней точкой следующей корзины
+        area = np.abs(
+            (x[selected] - avg_x) * (y[start:end] - y[selected])
+            - (x[selected] - x[start:end]) * (avg_y - y[selected])
+        )
+        selected = start + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        indices[i + 1] = selected
+    
+    return indices
+
+def downsample_frame(df, x_column, y_columns, threshold):
+    """Прореживание строк df до threshold точек с сохранением формы рядов y_columns (LTTB)
+
+    Индексы выбираются один раз на весь график: объединение точек LTTB каждого ряда
+    (по threshold / число рядов на ряд). Все линии получают одни и те же x, поэтому
+    заливки fill='tonexty' и подсказки hovermode='x unified' остаются согласованными.
+    """
+    try:
+        if len(df) <= threshold:
+            return df
+        x = df[x_column]
+        # Даты сравниваются как наносекунды, прочие подписи (месяцы) - по позиции
+        if pd.api.types.is_datetime64_any_dtype(x):
+            x_values = x.values.astype('datetime64[ns]').astype('int64')
+        else:
+            x_values = np.arange(len(x))
+        per_series = max(threshold // len(y_columns), 3)
+        indices = np.unique(np.concatenate([
+            lttb_indices(x_values, df[column].to_numpy(dtype='float64', na_value=np.nan), per_series)
+            for column in y_columns
+        ]))
+        return df.iloc[indices]
     except Exception as e:
-        log_error(f"Ошибка при категоризации расходов: {str(e)}")
-        return pd.Series() 
\ No newline at end of file
+        log_error("Ошибка при прореживании временного ряда: {}", e)
+        return df
+
+class RollingStatistics:
+    """Скользящие статистики для нескольких рядов одновременно
+
+    Ряды - колонки DataFrame (например, расходы по категориям за месяцы). Для окна
+    window по всей матрице значений сразу считаются среднее (sma), минимум, максимум,
+    стандартное отклонение и перцентили quantiles, а при заданном span - EWMA.
+    Результат сохраняется: при добавлении месяцев или изменении последних строк
+    update() пересчитывает только затронутый хвост.
+    """
+
+    def __init__(self, window=3, span=None, quantiles=(), min_periods=1):
+        self.window = window
+        self.span = span
+        self.quantiles = tuple(quantiles)
+        self.min_periods = min_periods
+        self.data = None
+        self.result = {}
+        self.is_series = False
+
+    def as_frame(self, data):
+        """Приведение входных данных к DataFrame с запоминанием исходного вида"""
+        self.is_series = isinstance(data, pd.Series)
+        return data.to_frame() if self.is_series else data
+
+    def window_stats(self, values, skip):
+        """Статистики окна для строк values[skip:], предыдущие строки - история окна"""
+        columns = values.shape[1]
+        padded = np.vstack([np.full((self.window - 1, columns), np.nan), values])
+        # Окна - представление без копирования: (строки, ряды, окно)
+        windows = sliding_window_view(padded, self.window, axis=0)[skip:]
+        too_few = np.sum(~np.isnan(windows), axis=-1) < self.min_periods
+        
+        with warnings.catch_warnings():
+            # Окна из одних пропусков дают NaN, предупреждения numpy об этом не нужны
+            warnings.simplefilter('ignore', category=RuntimeWarning)
+            stats = {
+                'sma': np.nanmean(windows, axis=-1),
+                'min': np.nanmin(windows, axis=-1),
+                'max': np.nanmax(windows, axis=-1),
+                'std': np.nanstd(windows, axis=-1, ddof=1)
+            }
+            if self.quantiles:
+                percentiles = np.nanpercentile(windows, [q * 100 for q in self.quantiles], axis=-1)
+                for q, values in zip(self.quantiles, percentiles):
+                    stats[f'p{round(q * 100)}'] = values
+        for values in stats.values():
+            values[too_few] = np.nan
+        return stats
+
+    def ewma(self, values, previous):
+        """Экспоненциальное сглаживание, продолжающее ряд от значения previous"""
+        alpha = 2 / (self.span + 1)
+        result = np.empty_like(values)
+        for i, row in enumerate(values):
+            smoothed = alpha * row + (1 - alpha) * previous
+            previous = np.where(np.isnan(previous), row, np.where(np.isnan(row), previous, smoothed))
+            result[i] = previous
+        return result
+
+    def compute(self, data, start):
+        """Статистики для строк data начиная с позиции start"""
+        values = data.to_numpy(dtype='float64', na_value=np.nan)
+        history = max(start - (self.window - 1), 0)
+        stats = self.window_stats(values[history:], start - history)
+        if self.span is not None:
+            previous = (
+                self.result['ewma'].iloc[start - 1].to_numpy(dtype='float64')
+                if start > 0 else np.full(values.shape[1], np.nan)
+            )
+            stats['ewma'] = self.ewma(values[start:], previous)
+        return {
+            name: pd.DataFrame(values, index=data.index[start:], columns=data.columns)
+            for name, values in stats.items()
+        }
+
+    def fit(self, data):
+        """Расчет статистик по всей истории"""
+        self.data = self.as_frame(data)
+        self.result = self.compute(self.data, 0)
+        return self.statistics()
+
+    def update(self, data):
+        """Пересчет после изменения данных начиная с первой отличающейся строки"""
+        frame = self.as_frame(data)
+        if self.data is None or not frame.columns.equals(self.data.columns):
+            # Новые ряды меняют всю матрицу, статистики считаются заново
+            return self.fit(data)
+        
+        common = min(len(frame), len(self.data))
+        old = self.data.to_numpy(dtype='float64', na_value=np.nan)[:common]
+        new = frame.to_numpy(dtype='float64', na_value=np.nan)[:common]
+        unchanged = (frame.index[:common] == self.data.index[:common]) & (
+            (old == new) | (np.isnan(old) & np.isnan(new))
+        ).all(axis=1)
+        start = common if unchanged.all() else int(np.argmin(unchanged))
+        
+        if start < len(frame):
+            tail = self.compute(frame, start)
+            self.result = {
+                name: pd.concat([self.result[name].iloc[:start], values])
+                for name, values in tail.items()
+            }
+        else:
+            self.result = {name: values.iloc[:start] for name, values in self.result.items()}
+        self.data = frame
+        log_debug("Скользящие статистики пересчитаны с позиции {} из {}", start, len(frame))
+        return self.statistics()
+
+    def statistics(self):
+        """Результат в виде исходных данных: Series для одного ряда, DataFrame для нескольких"""
+        if self.is_series:
+            return {name: values.iloc[:, 0] for name, values in self.result.items()}
+        return dict(self.result)
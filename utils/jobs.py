@@ -0,0 +1,97 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from utils.logger import log_debug, log_error
+
+class Job:
+    """Состояние фоновой задачи: статус, прогресс, результат или ошибка"""
+
+    def __init__(self, job_id, name):
+        self.id = job_id
+        self.name = name
+        self.status = 'pending'
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.exception = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._finished = threading.Event()
+
+    def is_finished(self):
+        """Задача завершена успешно или с ошибкой"""
+        return self.status in ('done', 'failed')
+
+    def wait(self, timeout=None):
+        """Ожидание завершения задачи не дольше timeout секунд; True, если задача завершена"""
+        return self._finished.wait(timeout)
+
+    def update_progress(self, key, **values):
+        """Обновление счетчиков прогресса по отдельному этапу (например, листу)"""
+        with self._lock:
+            self.progress.setdefault(key, {}).update(values)
+
+    def snapshot(self):
+        """Согласованная копия состояния для отображения в интерфейсе"""
+        with self._lock:
+            return {
+                'id': self.id,
+                'name': self.name,
+                'status': self.status,
+                'progress': {key: dict(values) for key, values in self.progress.items()},
+                'result': self.result,
+                'error': self.error
+            }
+
+class JobRunner:
+    """Пул потоков для фоновых задач с доступом к их состоянию по идентификатору
+
+    Задачи переживают перезапуски скрипта Streamlit и переходы между страницами,
+    так как пул и реестр задач живут на уровне процесса.
+    """
+
+    def __init__(self, max_workers, max_history=50):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.max_history = max_history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, name, fn, *args, job_id=None):
+        """Запуск задачи; функция получает объект Job первым аргументом"""
+        job = Job(job_id or uuid.uuid4().hex, name)
+        with self._lock:
+            self._jobs[job.id] = job
+            self.prune()
+        self.executor.submit(self.run, job, fn, *args)
+        log_debug("Фоновая задача {} поставлена в очередь: {}", name, job.id)
+        return job
+
+    def run(self, job, fn, *args):
+        """Выполнение задачи с фиксацией результата или ошибки"""
+        job.status = 'running'
+        try:
+            job.result = fn(job, *args)
+            job.status = 'done'
+            log_debug("Фоновая задача {} завершена: {}", job.name, job.id)
+        except Exception as e:
+            job.error = str(e)
+            job.exception = e
+            job.status = 'failed'
+            log_error("Ошибка фоновой задачи {}: {}", job.name, e)
+        finally:
+            job.finished_at = time.time()
+            job._finished.set()
+
+    def get(self, job_id):
+        """Задача по идентификатору или None, если она неизвестна"""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def prune(self):
+        """Удаление самых старых завершенных задач сверх лимита истории"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished()]
+        for job_id in finished[:max(len(self._jobs) - self.max_history, 0)]:
+            del self._jobs[job_id]
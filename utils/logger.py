@@ -2,39 +2,60 @@ from loguru import logger
 import sys
 from config import DEBUG, LOG_CONFIG
 
+# Уровень по умолчанию и уровни отдельных модулей (имя модуля -> уровень)
+DEFAULT_LEVEL = "DEBUG" if DEBUG else "INFO"
+LEVELS = {"": DEFAULT_LEVEL, **{module.strip(): level.strip().upper() for module, level in LOG_CONFIG["MODULE_LEVELS"].items()}}
+
+# Отладочные вызовы отбрасываются сразу, если ни один модуль не пишет уровень DEBUG
+DEBUG_ENABLED = any(logger.level(level).no <= logger.level("DEBUG").no for level in LEVELS.values())
+
+LOG_FORMAT = "{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+
 # Настройка логгера
 logger.remove()  # Удаление стандартного обработчика
 
-# Добавление обработчика для файла
+# Обработчики пишут из фонового потока через очередь (enqueue), не блокируя поток скрипта
 if DEBUG:
     logger.add(
-        "logs/app.log",
-        rotation="500 MB",
-        retention="10 days",
+        LOG_CONFIG["LOG_FILE"],
+        rotation=LOG_CONFIG["MAX_SIZE"],
+        retention=LOG_CONFIG["RETENTION"],
         level="DEBUG",
-        format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+        filter=LEVELS,
+        format=LOG_FORMAT,
+        serialize=LOG_CONFIG["JSON"],
+        enqueue=True
     )
 
 # Добавление обработчика для консоли
 logger.add(
     sys.stderr,
-    level="INFO" if not DEBUG else "DEBUG",
-    format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}"
+    level="DEBUG" if DEBUG_ENABLED else "INFO",
+    filter=LEVELS,
+    format=LOG_FORMAT,
+    serialize=LOG_CONFIG["JSON"],
+    enqueue=True
 )
 
-def log_debug(message):
+# Записи относятся к модулю, вызвавшему log_*, а не к этому модулю
+caller = logger.opt(depth=1)
+
+# Сообщение форматируется только для записей, прошедших фильтр уровней:
+# log_debug("Лист {} обработан: {} строк", sheet_name, rows)
+
+def log_debug(message, *args):
     """Логирование отладочной информации"""
-    if DEBUG:
-        logger.debug(message)
+    if DEBUG_ENABLED:
+        caller.debug(message, *args)
 
-def log_info(message):
+def log_info(message, *args):
     """Логирование информационных сообщений"""
-    logger.info(message)
+    caller.info(message, *args)
 
-def log_warning(message):
+def log_warning(message, *args):
     """Логирование предупреждений"""
-    logger.warning(message)
+    caller.warning(message, *args)
 
-def log_error(message):
+def log_error(message, *args):
     """Логирование ошибок"""
-    logger.error(message) 
\ No newline at end of file
+    caller.error(message, *args)
@@ -0,0 +1,93 @@
+import copy
+
+class Query:
+    """Ленивый запрос к листу данных
+
+    Методы columns/between/where/group_by возвращают новый запрос и ничего не читают.
+    Чтение выполняется при вызове execute(): хранилищу передаются только нужные
+    колонки, период и условия отбора.
+
+    Суммы в результате execute() - в рублях (в хранилище они хранятся в копейках).
+
+    Пример: data_loader.query('expenses').between(start, end).where(category='Еда').group_by('month')
+    """
+
+    def __init__(self, executor, data_type, available_columns):
+        self.executor = executor
+        self.data_type = data_type
+        self.available_columns = list(available_columns)
+        self.selected = None
+        self.start = None
+        self.end = None
+        self.filters = {}
+        self.group_keys = None
+        self.value = 'Amount'
+
+    def resolve(self, name):
+        """Имя колонки листа без учета регистра: 'category' -> 'Category'"""
+        for column in self.available_columns:
+            if column.lower() == name.lower():
+                return column
+        raise ValueError(f"Лист {self.data_type} не содержит колонку {name}")
+
+    def derive(self, **changes):
+        """Копия запроса с измененными параметрами"""
+        query = copy.copy(self)
+        query.filters = dict(self.filters)
+        for name, value in changes.items():
+            setattr(query, name, value)
+        return query
+
+    def columns(self, *names):
+        """Ограничение набора возвращаемых колонок"""
+        return self.derive(selected=[self.resolve(name) for name in names])
+
+    def between(self, start=None, end=None):
+        """Строки за период [start, end] по колонке Date"""
+        self.resolve('Date')
+        return self.derive(start=start, end=end)
+
+    def where(self, **conditions):
+        """Отбор строк по равенству колонки значению или вхождению в список значений"""
+        query = self.derive()
+        for name, values in conditions.items():
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            query.filters[self.resolve(name)] = tuple(values)
+        return query
+
+    def group_by(self, *keys, value='Amount'):
+        """Сумма value по ключам; 'day' и 'month' - группировка по дням и месяцам колонки Date"""
+        resolved = [key.capitalize() if key.lower() in ('day', 'month') else self.resolve(key) for key in keys]
+        if 'Day' in resolved or 'Month' in resolved:
+            self.resolve('Date')
+        return self.derive(group_keys=resolved, value=self.resolve(value))
+
+    def needed_columns(self):
+        """Колонки, которые нужно прочитать из хранилища для выполнения запроса"""
+        if self.group_keys is not None:
+            needed = [key for key in self.group_keys if key not in ('Day', 'Month')] + [self.value]
+            if 'Day' in self.group_keys or 'Month' in self.group_keys:
+                needed.append('Date')
+        else:
+            needed = list(self.selected or self.available_columns)
+        if self.start is not None or self.end is not None:
+            needed.append('Date')
+        needed.extend(self.filters)
+        return [column for column in self.available_columns if column in needed]
+
+    def key(self):
+        """Хэшируемое описание запроса для кэширования результата"""
+        return (
+            self.data_type,
+            tuple(self.selected) if self.selected else None,
+            None if self.start is None else str(self.start),
+            None if self.end is None else str(self.end),
+            tuple(sorted(self.filters.items())),
+            tuple(self.group_keys) if self.group_keys is not None else None,
+            self.value
+        )
+
+    def execute(self):
+        """Выполнение запроса"""
+        return self.executor(self)
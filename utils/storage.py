@@ -0,0 +1,550 @@
+import os
+import shutil
+import sqlite3
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from utils.logger import log_debug, log_warning
+
+# Даты хранятся в SQLite строками ISO, их лексикографический порядок совпадает с хронологическим
+SQLITE_TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# Соответствие объявленных типов колонок SQLite типам Arrow
+SQLITE_ARROW_TYPES = {
+    'INTEGER': pa.int64(),
+    'REAL': pa.float64(),
+    'TIMESTAMP': pa.timestamp('ns'),
+    'TEXT': pa.string()
+}
+
+def normalize_schema(schema):
+    """Единая схема для всех частей листа независимо от содержимого пакета
+
+    Пустые колонки сохраняются как строковые, а словарные (categorical) -
+    с индексом int32, чтобы пакеты с разным числом категорий были совместимы.
+    """
+    fields = []
+    for field in schema:
+        if pa.types.is_null(field.type):
+            field = field.with_type(pa.string())
+        elif pa.types.is_dictionary(field.type):
+            field = field.with_type(pa.dictionary(pa.int32(), field.type.value_type))
+        fields.append(field)
+    return pa.schema(fields, metadata=schema.metadata)
+
+def sql_type(dtype):
+    """Тип колонки SQLite для типа колонки pandas"""
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return 'TIMESTAMP'
+    if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+        return 'INTEGER'
+    if pd.api.types.is_float_dtype(dtype):
+        return 'REAL'
+    return 'TEXT'
+
+def parquet_filters(start=None, end=None, filters=None):
+    """Условия отбора строк в формате pyarrow: период по Date и допустимые значения колонок"""
+    predicates = []
+    if start is not None:
+        predicates.append(('Date', '>=', pd.Timestamp(start)))
+    if end is not None:
+        predicates.append(('Date', '<=', pd.Timestamp(end)))
+    for column, values in (filters or {}).items():
+        predicates.append((column, 'in', list(values)))
+    return predicates or None
+
+def sql_conditions(start=None, end=None, filters=None):
+    """Условие WHERE и его параметры: период по Date и допустимые значения колонок"""
+    conditions = []
+    params = []
+    if start is not None:
+        conditions.append("Date >= ?")
+        params.append(pd.Timestamp(start).strftime(SQLITE_TIMESTAMP_FORMAT))
+    if end is not None:
+        conditions.append("Date <= ?")
+        params.append(pd.Timestamp(end).strftime(SQLITE_TIMESTAMP_FORMAT))
+    for column, values in (filters or {}).items():
+        values = [value.item() if hasattr(value, 'item') else value for value in values]
+        conditions.append(f'"{column}" IN ({", ".join("?" * len(values))})')
+        params.extend(values)
+    return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+def restore_types(df, declared):
+    """Восстановление типов pandas по объявленным типам колонок SQLite"""
+    for column, declared_type in declared.items():
+        if declared_type == 'TIMESTAMP':
+            df[column] = pd.to_datetime(df[column])
+        elif declared_type == 'INTEGER':
+            # Целые с пропусками читаются как float, Int64 сохраняет точность копеек
+            df[column] = df[column].astype('Int64')
+    return df
+
+class ParquetStore:
+    """Колоночное хранилище листов финансовых данных в формате Parquet
+
+    Каждая загрузка записывается в отдельный каталог-снимок, а файл CURRENT
+    указывает на активную версию. Переключение версии выполняется атомарной
+    заменой CURRENT, поэтому читатели никогда не видят частично записанные данные.
+
+    Лист может состоять из основного файла и дополнительных частей, записанных
+    при добавлении новых строк. Неизмененные файлы переносятся в новый снимок
+    жесткими ссылками, так что стоимость добавления пропорциональна объему новых данных.
+    """
+
+    # Помесячные агрегаты сохраняются в снимок при загрузке
+    materializes_rollups = True
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.pointer_file = self.root / "CURRENT"
+        # Последняя прочитанная версия и признак файла-указателя, при котором она прочитана
+        self.version_cache = (None, None)
+        # Снимки, которые еще записываются: их нельзя удалять при фиксации другого снимка
+        self.pending = set()
+
+    def version_stamp(self):
+        """Признак изменения указателя на активный снимок: inode, время и размер файла"""
+        try:
+            stat = os.stat(self.pointer_file)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def current_version(self):
+        """Имя активного снимка или None, если данные еще не загружались"""
+        # Указатель перечитывается только после его замены
+        stamp = self.version_stamp()
+        cached_stamp, version = self.version_cache
+        if stamp is not None and stamp == cached_stamp:
+            return version
+        try:
+            version = self.pointer_file.read_text().strip() or None
+        except FileNotFoundError:
+            version = None
+        self.version_cache = (stamp, version)
+        return version
+
+    def begin_snapshot(self, version, base_version=None, keys=()):
+        """Создание каталога для нового снимка, при необходимости на основе существующего"""
+        if version == self.current_version():
+            raise ValueError(f"Снимок {version} уже активен")
+        self.pending.add(version)
+        snapshot_dir = self.root / version
+        if snapshot_dir.exists():
+            shutil.rmtree(snapshot_dir)
+        snapshot_dir.mkdir(parents=True)
+
+        for key in keys:
+            for source in self.sheet_files(key, base_version):
+                target = snapshot_dir / source.name
+                try:
+                    os.link(source, target)
+                except OSError:
+                    shutil.copy2(source, target)
+        return version
+
+    def discard_snapshot(self, version):
+        """Удаление неактивированного снимка после ошибки загрузки"""
+        self.pending.discard(version)
+        if version != self.current_version():
+            shutil.rmtree(self.root / version, ignore_errors=True)
+
+    def commit_snapshot(self, version):
+        """Атомарное переключение на новый снимок и удаление старых"""
+        # Предыдущий снимок сохраняется для читателей, начавших чтение до переключения
+        previous = self.current_version()
+        tmp_pointer = self.pointer_file.with_suffix(".tmp")
+        tmp_pointer.write_text(version)
+        os.replace(tmp_pointer, self.pointer_file)
+        self.version_cache = (self.version_stamp(), version)
+        self.pending.discard(version)
+        log_debug("Активирован снимок данных {}", version)
+
+        keep = {version, previous} | self.pending
+        for path in self.root.iterdir():
+            if path.is_dir() and path.name not in keep:
+                try:
+                    shutil.rmtree(path)
+                except OSError as e:
+                    log_warning("Не удалось удалить старый снимок {}: {}", path.name, e)
+
+    def path(self, key, version=None):
+        """Путь к файлу листа в снимке"""
+        version = version or self.current_version()
+        return self.root / version / f"{key}.parquet"
+
+    def exists(self, key, version=None):
+        """Проверка наличия листа в хранилище"""
+        version = version or self.current_version()
+        return version is not None and self.path(key, version).exists()
+
+    def sheet_files(self, key, version=None):
+        """Основной файл листа и дополнительные части в порядке добавления"""
+        version = version or self.current_version()
+        if version is None:
+            return []
+        snapshot_dir = self.root / version
+        return sorted(snapshot_dir.glob(f"{key}.parquet")) + sorted(snapshot_dir.glob(f"{key}.part-*.parquet"))
+
+    def size(self, key, version=None):
+        """Объем листа на диске в байтах"""
+        return sum(path.stat().st_size for path in self.sheet_files(key, version))
+
+    def write(self, key, df, version):
+        """Запись листа в еще не активированный снимок"""
+        path = self.path(key, version)
+        # Файл может быть жесткой ссылкой на предыдущий снимок, его нельзя перезаписывать на месте
+        path.unlink(missing_ok=True)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table.cast(normalize_schema(table.schema)), path)
+        log_debug("Лист {} сохранен в {}", key, path)
+
+    def write_batches(self, key, batches, version, on_batch=None):
+        """Потоковая запись листа пакетами, каждый пакет становится группой строк
+        
+        on_batch, если задан, вызывается после каждого пакета с текущим размером файла.
+        """
+        path = self.path(key, version)
+        path.unlink(missing_ok=True)
+        writer = None
+        rows = 0
+        try:
+            for df in batches:
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, normalize_schema(table.schema))
+                writer.write_table(table.cast(writer.schema))
+                rows += len(df)
+                if on_batch is not None:
+                    on_batch(path.stat().st_size)
+        finally:
+            if writer is not None:
+                writer.close()
+        log_debug("Лист {} сохранен в {} потоково: {} строк", key, path, rows)
+        return rows
+
+    def schema(self, key, version=None):
+        """Схема Arrow основного файла листа"""
+        return pq.read_schema(self.sheet_files(key, version)[0])
+
+    def append(self, key, df, version):
+        """Добавление строк к листу отдельной частью со схемой основного файла"""
+        parts = self.sheet_files(key, version)
+        schema = self.schema(key, version)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        table = table.select(schema.names).cast(schema)
+        path = self.root / version / f"{key}.part-{len(parts):05d}.parquet"
+        pq.write_table(table, path)
+        log_debug("К листу {} добавлено {} строк в {}", key, len(df), path)
+        return len(df)
+
+    def read(self, key, columns=None, version=None, start=None, end=None, filters=None):
+        """Чтение листа (всех его частей) с отображением файлов в память
+        
+        start/end ограничивают колонку Date, filters - словарь {колонка: допустимые значения}.
+        Группы строк, не подходящие по статистике, не читаются.
+        """
+        predicates = parquet_filters(start, end, filters)
+        tables = [
+            pq.read_table(path, columns=columns, filters=predicates, memory_map=True)
+            for path in self.sheet_files(key, version)
+        ]
+        table = tables[0] if len(tables) == 1 else pa.concat_tables(
+            [table.cast(tables[0].schema) for table in tables]
+        )
+        return table.to_pandas()
+
+class SQLiteStore:
+    """Хранилище листов финансовых данных в локальной базе SQLite
+
+    Каждая часть листа - отдельная физическая таблица с индексами по Date,
+    Category и Source. Таблица manifest связывает версии со списком частей,
+    поэтому новый снимок на основе существующего создается без копирования данных,
+    а переключение версии - одна транзакция. Журнал WAL позволяет читать базу
+    из нескольких сессий одновременно с загрузкой нового файла.
+
+    Агрегаты не материализуются: группировка и фильтрация по дате выполняются
+    запросом SQL с использованием индексов.
+    """
+
+    materializes_rollups = False
+    indexed_columns = ('Date', 'Category', 'Source')
+
+    def __init__(self, path):
+        self.db_path = Path(path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Снимки, которые еще записываются: их нельзя удалять при фиксации другого снимка
+        self.pending = set()
+        # Последняя прочитанная версия и признак файлов базы, при котором она прочитана
+        self.version_cache = (None, None)
+        with self.connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS manifest ("
+                "version TEXT NOT NULL, key TEXT NOT NULL, part INTEGER NOT NULL, "
+                "table_name TEXT NOT NULL, PRIMARY KEY (version, key, part))"
+            )
+
+    @contextmanager
+    def connect(self):
+        """Отдельное соединение на операцию: соединения SQLite нельзя делить между потоками"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def version_stamp(self):
+        """Признак изменения базы: время и размер файла базы и журнала WAL"""
+        stamp = []
+        for path in (self.db_path, self.db_path.with_name(self.db_path.name + "-wal")):
+            try:
+                stat = os.stat(path)
+                stamp.append((stat.st_mtime_ns, stat.st_size))
+            except FileNotFoundError:
+                stamp.append(None)
+        return tuple(stamp)
+
+    def current_version(self):
+        """Имя активного снимка или None, если данные еще не загружались"""
+        # Пока файлы базы не менялись, версия берется из памяти без открытия соединения
+        stamp = self.version_stamp()
+        cached_stamp, version = self.version_cache
+        if stamp == cached_stamp:
+            return version
+        with self.connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE name = 'current'").fetchone()
+        version = row[0] if row else None
+        self.version_cache = (stamp, version)
+        return version
+
+    def begin_snapshot(self, version, base_version=None, keys=()):
+        """Регистрация нового снимка, при необходимости со ссылками на части существующего"""
+        if version == self.current_version():
+            raise ValueError(f"Снимок {version} уже активен")
+        self.pending.add(version)
+        with self.connect() as conn:
+            conn.execute("DELETE FROM manifest WHERE version = ?", (version,))
+            for key in keys:
+                conn.execute(
+                    "INSERT INTO manifest (version, key, part, table_name) "
+                    "SELECT ?, key, part, table_name FROM manifest WHERE version = ? AND key = ?",
+                    (version, base_version, key)
+                )
+            self.drop_orphans(conn)
+        return version
+
+    def discard_snapshot(self, version):
+        """Удаление неактивированного снимка после ошибки загрузки"""
+        self.pending.discard(version)
+        if version == self.current_version():
+            return
+        with self.connect() as conn:
+            conn.execute("DELETE FROM manifest WHERE version = ?", (version,))
+            self.drop_orphans(conn)
+
+    def commit_snapshot(self, version):
+        """Атомарное переключение на новый снимок и удаление старых"""
+        with self.connect() as conn:
+            # Предыдущий снимок сохраняется для читателей, начавших чтение до переключения
+            row = conn.execute("SELECT value FROM meta WHERE name = 'current'").fetchone()
+            previous = row[0] if row else None
+            conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('current', ?)", (version,))
+            self.pending.discard(version)
+            keep = [version, previous or version, *self.pending]
+            conn.execute(
+                f"DELETE FROM manifest WHERE version NOT IN ({', '.join('?' * len(keep))})",
+                keep
+            )
+            self.drop_orphans(conn)
+        self.version_cache = (self.version_stamp(), version)
+        log_debug("Активирован снимок данных {}", version)
+
+    def drop_orphans(self, conn):
+        """Удаление физических таблиц, на которые не ссылается ни один снимок"""
+        referenced = {row[0] for row in conn.execute("SELECT table_name FROM manifest")}
+        tables = [
+            row[0] for row in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'part\\_%' ESCAPE '\\'"
+            )
+        ]
+        for table in tables:
+            if table not in referenced:
+                conn.execute(f'DROP TABLE "{table}"')
+
+    def parts(self, key, version=None, conn=None):
+        """Физические таблицы листа в порядке добавления"""
+        version = version or self.current_version()
+        if version is None:
+            return []
+        if conn is None:
+            with self.connect() as conn:
+                return self.parts(key, version, conn)
+        rows = conn.execute(
+            "SELECT table_name FROM manifest WHERE version = ? AND key = ? ORDER BY part",
+            (version, key)
+        )
+        return [row[0] for row in rows]
+
+    def exists(self, key, version=None):
+        """Проверка наличия листа в хранилище"""
+        return bool(self.parts(key, version))
+
+    def create_part(self, conn, key, df):
+        """Создание физической таблицы по типам колонок DataFrame"""
+        table = f"part_{key}_{uuid.uuid4().hex[:12]}"
+        columns = ", ".join(f'"{column}" {sql_type(df[column].dtype)}' for column in df.columns)
+        conn.execute(f'CREATE TABLE "{table}" ({columns})')
+        return table
+
+    def insert_rows(self, conn, table, df):
+        """Вставка строк DataFrame с приведением значений к типам SQLite"""
+        if df.empty:
+            return
+        values = []
+        for column in df.columns:
+            series = df[column]
+            if pd.api.types.is_datetime64_any_dtype(series):
+                series = series.dt.strftime(SQLITE_TIMESTAMP_FORMAT)
+            values.append(series.astype(object).where(series.notna(), None))
+        placeholders = ", ".join("?" * len(df.columns))
+        conn.executemany(f'INSERT INTO "{table}" VALUES ({placeholders})', zip(*values))
+
+    def create_indexes(self, conn, table, columns):
+        """Индексы по колонкам, используемым для фильтрации и группировки"""
+        for column in self.indexed_columns:
+            if column in columns:
+                conn.execute(f'CREATE INDEX "{table}_{column}" ON "{table}" ("{column}")')
+
+    def register(self, conn, key, version, tables):
+        """Замена списка частей листа в снимке"""
+        conn.execute("DELETE FROM manifest WHERE version = ? AND key = ?", (version, key))
+        conn.executemany(
+            "INSERT INTO manifest (version, key, part, table_name) VALUES (?, ?, ?, ?)",
+            [(version, key, part, table) for part, table in enumerate(tables)]
+        )
+
+    def write(self, key, df, version):
+        """Запись листа в еще не активированный снимок"""
+        with self.connect() as conn:
+            table = self.create_part(conn, key, df)
+            self.insert_rows(conn, table, df)
+            self.create_indexes(conn, table, df.columns)
+            self.register(conn, key, version, [table])
+        log_debug("Лист {} сохранен в таблицу {}", key, table)
+
+    def write_batches(self, key, batches, version, on_batch=None):
+        """Потоковая запись листа пакетами, индексы строятся после вставки всех строк
+
+        on_batch, если задан, вызывается после каждого пакета с текущим размером листа.
+        """
+        rows = 0
+        with self.connect() as conn:
+            table = None
+            columns = None
+            for df in batches:
+                if table is None:
+                    table = self.create_part(conn, key, df)
+                    columns = list(df.columns)
+                self.insert_rows(conn, table, df[columns])
+                rows += len(df)
+                if on_batch is not None:
+                    on_batch(self.table_size(conn, [table]))
+            if table is not None:
+                self.create_indexes(conn, table, columns)
+                self.register(conn, key, version, [table])
+        log_debug("Лист {} сохранен в таблицу {} потоково: {} строк", key, table, rows)
+        return rows
+
+    def columns(self, conn, table):
+        """Колонки физической таблицы с объявленными типами"""
+        return [(row[1], row[2]) for row in conn.execute(f'PRAGMA table_info("{table}")')]
+
+    def schema(self, key, version=None):
+        """Схема Arrow листа по объявленным типам колонок основной части"""
+        with self.connect() as conn:
+            columns = self.columns(conn, self.parts(key, version, conn)[0])
+        return pa.schema([(name, SQLITE_ARROW_TYPES[declared]) for name, declared in columns])
+
+    def append(self, key, df, version):
+        """Добавление строк к листу отдельной частью с колонками основной части"""
+        with self.connect() as conn:
+            tables = self.parts(key, version, conn)
+            columns = [name for name, _ in self.columns(conn, tables[0])]
+            table = self.create_part(conn, key, df[columns])
+            self.insert_rows(conn, table, df[columns])
+            self.create_indexes(conn, table, columns)
+            self.register(conn, key, version, tables + [table])
+        log_debug("К листу {} добавлено {} строк в таблицу {}", key, len(df), table)
+        return len(df)
+
+    def table_size(self, conn, tables):
+        """Объем таблиц и их индексов на диске в байтах"""
+        try:
+            placeholders = ", ".join("?" * len(tables))
+            row = conn.execute(
+                f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({placeholders}) "
+                f"OR name IN (SELECT name FROM sqlite_master WHERE tbl_name IN ({placeholders}))",
+                tables + tables
+            ).fetchone()
+            return row[0] or 0
+        except sqlite3.OperationalError:
+            # Сборка SQLite без виртуальной таблицы dbstat
+            return 0
+
+    def size(self, key, version=None):
+        """Объем листа на диске в байтах"""
+        with self.connect() as conn:
+            tables = self.parts(key, version, conn)
+            return self.table_size(conn, tables) if tables else 0
+
+    def source(self, key, version, conn):
+        """Подзапрос, объединяющий все части листа"""
+        tables = self.parts(key, version, conn)
+        if not tables:
+            raise FileNotFoundError(f"Лист {key} отсутствует в снимке {version}")
+        return " UNION ALL ".join(f'SELECT * FROM "{table}"' for table in tables), tables[0]
+
+    def read(self, key, columns=None, version=None, start=None, end=None, filters=None):
+        """Чтение листа (всех его частей) с восстановлением типов колонок
+        
+        start/end ограничивают колонку Date, filters - словарь {колонка: допустимые значения}.
+        """
+        where, params = sql_conditions(start, end, filters)
+        with self.connect() as conn:
+            source, first = self.source(key, version, conn)
+            declared = dict(self.columns(conn, first))
+            selected = columns or list(declared)
+            select = ", ".join(f'"{column}"' for column in selected)
+            df = pd.read_sql_query(f"SELECT {select} FROM ({source}) {where}", conn, params=params)
+        return restore_types(df, {column: declared[column] for column in selected})
+
+    def aggregate(self, key, by, value='Amount', start=None, end=None, filters=None, version=None):
+        """Сумма value по колонкам by с условиями отбора, вычисляемая в SQLite
+
+        Колонки 'Day' и 'Month' в by означают группировку по дню и первому дню месяца даты.
+        """
+        periods = {
+            'Day': "strftime('%Y-%m-%d 00:00:00', Date) AS Day",
+            'Month': "strftime('%Y-%m-01 00:00:00', Date) AS Month"
+        }
+        keys = [periods.get(column, f'"{column}"') for column in by]
+        where, params = sql_conditions(start, end, filters)
+        group = ", ".join(f'"{column}"' for column in by)
+        
+        with self.connect() as conn:
+            source, _ = self.source(key, version, conn)
+            df = pd.read_sql_query(
+                f'SELECT {", ".join(keys)}, SUM("{value}") AS "{value}" FROM ({source}) {where} '
+                f'GROUP BY {group} ORDER BY {group}',
+                conn, params=params
+            )
+        types = {column: 'TIMESTAMP' if column in periods else 'TEXT' for column in by}
+        return restore_types(df, {**types, value: 'INTEGER'})
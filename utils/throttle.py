@@ -0,0 +1,105 @@
+import threading
+import time
+from collections import OrderedDict
+from utils.logger import log_warning
+
+class LoginThrottle:
+    """Ограничение частоты попыток входа: корзина токенов и экспоненциальная задержка
+
+    Каждая попытка расходует токен корзины ключа (имени пользователя или клиента),
+    токены восстанавливаются со скоростью один за refill_seconds. Подряд идущие
+    неудачи сверх free_failures блокируют ключ на backoff_base * 2^n секунд
+    (не дольше backoff_max). Корзины, не использованные idle_ttl секунд, удаляются,
+    а общее число корзин ограничено max_entries.
+    """
+
+    def __init__(self, capacity, refill_seconds, free_failures, backoff_base, backoff_max, idle_ttl, max_entries):
+        self.capacity = capacity
+        self.refill_seconds = refill_seconds
+        self.free_failures = free_failures
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idle_ttl = idle_ttl
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def bucket(self, key, now):
+        """Корзина ключа с восстановленными на момент now токенами"""
+        bucket = self._buckets.get(key)
+        if bucket is None or (now - bucket['updated_at'] > self.idle_ttl and bucket['blocked_until'] <= now):
+            bucket = {'tokens': float(self.capacity), 'updated_at': now, 'failures': 0, 'blocked_until': 0.0}
+        else:
+            elapsed = now - bucket['updated_at']
+            bucket['tokens'] = min(self.capacity, bucket['tokens'] + elapsed / self.refill_seconds)
+            bucket['updated_at'] = now
+        self._buckets[key] = bucket
+        self._buckets.move_to_end(key)
+        return bucket
+
+    def wait_time(self, bucket, now):
+        """Сколько секунд ждать до следующей разрешенной попытки; 0 - попытка разрешена"""
+        if bucket['blocked_until'] > now:
+            return bucket['blocked_until'] - now
+        if bucket['tokens'] < 1:
+            return (1 - bucket['tokens']) * self.refill_seconds
+        return 0.0
+
+    def acquire(self, *keys):
+        """Разрешение попытки для всех ключей: 0 или время ожидания в секундах
+
+        Токены расходуются только если попытка разрешена по всем ключам.
+        """
+        now = time.time()
+        with self._lock:
+            buckets = [self.bucket(key, now) for key in keys if key]
+            wait = max((self.wait_time(bucket, now) for bucket in buckets), default=0.0)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket['tokens'] -= 1
+            self.prune(now)
+            return wait
+
+    def failure(self, *keys):
+        """Учет неудачной попытки и продление блокировки ключей"""
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                if not key:
+                    continue
+                bucket = self.bucket(key, now)
+                bucket['failures'] += 1
+                excess = bucket['failures'] - self.free_failures
+                if excess > 0:
+                    delay = min(self.backoff_base * 2 ** (excess - 1), self.backoff_max)
+                    bucket['blocked_until'] = now + delay
+                    log_warning("Вход для {} заблокирован на {:.0f} с после {} неудачных попыток", key, delay, bucket['failures'])
+            self.prune(now)
+
+    def success(self, *keys):
+        """Сброс ограничений ключей после успешного входа"""
+        with self._lock:
+            for key in keys:
+                self._buckets.pop(key, None)
+
+    def prune(self, now):
+        """Удаление простаивающих корзин и самых старых сверх лимита
+
+        Сначала удаляются незаблокированные корзины (их блокировка истекла или не
+        назначалась): иначе поток попыток с новыми ключами сбрасывал бы задержку.
+        Если их не хватает, удаляются самые старые заблокированные, так что число
+        корзин никогда не превышает max_entries.
+        """
+        excess = len(self._buckets) - self.max_entries
+        # Корзины упорядочены по времени последнего обращения
+        for key, bucket in list(self._buckets.items()):
+            idle = now - bucket['updated_at'] > self.idle_ttl
+            if not idle and excess <= 0:
+                break
+            if bucket['blocked_until'] > now:
+                continue
+            del self._buckets[key]
+            excess -= 1
+        while excess > 0:
+            self._buckets.popitem(last=False)
+            excess -= 1